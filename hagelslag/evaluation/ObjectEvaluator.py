@@ -1,8 +1,8 @@
 import numpy as np
 import pandas as pd
-import json
 from glob import glob
 from hagelslag.evaluation.ProbabilityMetrics import DistributedCRPS, DistributedReliability, DistributedROC
+from hagelslag.processing.GeoJSONTrack import GeoJSONTrack
 from scipy.stats import gamma
 
 
@@ -66,25 +66,41 @@ class ObjectEvaluator(object):
         forecast_path = self.forecast_json_path + "/{0}/{1}/".format(self.run_date.strftime("%Y%m%d"),
                                                                      self.ensemble_member)
         forecast_files = sorted(glob(forecast_path + "*.json"))
+        rows = {}
+        step_ids = {}
+        for model_type in self.model_types:
+            rows[model_type] = {}
+            step_ids[model_type] = {}
+            for model_name in self.model_names[model_type]:
+                rows[model_type][model_name] = []
+                step_ids[model_type][model_name] = []
         for forecast_file in forecast_files:
-            file_obj = open(forecast_file)
-            json_obj = json.load(file_obj)
-            file_obj.close()
-            track_id = json_obj['properties']["id"]
-            obs_track_id = json_obj['properties']["obs_track_id"]
-            forecast_hours = json_obj['properties']['times']
-            duration = json_obj['properties']['duration']
-            for f, feature in enumerate(json_obj['features']):
-                area = np.sum(feature["properties"]["masks"])
-                step_id = track_id + "_{0:02d}".format(f)
-                for model_type in self.model_types:
-                    for model_name in self.model_names[model_type]:
-                        prediction = feature['properties'][model_type + "_" + model_name.replace(" ", "-")]
+            # Only the masks and forecasts of each step are parsed from the track file.
+            track = GeoJSONTrack(forecast_file)
+            track_id = track.properties["id"]
+            obs_track_id = track.properties["obs_track_id"]
+            forecast_hours = track.properties['times']
+            duration = track.properties['duration']
+            areas = [np.sum(mask) for mask in track.feature_properties("masks")]
+            for model_type in self.model_types:
+                for model_name in self.model_names[model_type]:
+                    predictions = track.feature_properties(model_type + "_" + model_name.replace(" ", "-"))
+                    for f, prediction in enumerate(predictions):
                         if model_type == "condition":
                             prediction = [prediction]
-                        row = [track_id, obs_track_id, self.ensemble_name, self.ensemble_member, forecast_hours[f],
-                               f + 1, duration, area] + prediction
-                        self.forecasts[model_type][model_name].loc[step_id] = row
+                        step_ids[model_type][model_name].append(track_id + "_{0:02d}".format(f))
+                        rows[model_type][model_name].append([track_id, obs_track_id, self.ensemble_name,
+                                                             self.ensemble_member, forecast_hours[f], f + 1, duration,
+                                                             areas[f]] + prediction)
+        for model_type in self.model_types:
+            for model_name in self.model_names[model_type]:
+                forecasts = self.forecasts[model_type][model_name]
+                new_forecasts = pd.DataFrame(rows[model_type][model_name], index=step_ids[model_type][model_name],
+                                             columns=forecasts.columns)
+                if forecasts.shape[0] > 0:
+                    new_forecasts = pd.concat([forecasts.loc[~forecasts.index.isin(new_forecasts.index)],
+                                               new_forecasts])
+                self.forecasts[model_type][model_name] = new_forecasts
 
     def load_obs(self):
         """
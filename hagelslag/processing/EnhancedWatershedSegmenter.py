@@ -11,7 +11,9 @@
 """
 
 import numpy as np
-from scipy.ndimage import find_objects
+from scipy.ndimage import label, find_objects, maximum_filter
+from scipy.spatial import cKDTree
+from .size_filter import size_filter
 from collections import OrderedDict
 
 
@@ -27,16 +29,26 @@ class EnhancedWatershed(object):
         max_intensity (int): values greater than maxThresh are treated as the maximum threshold
         size_threshold_pixels (int): clusters smaller than this threshold are ignored.
         delta (int): maximum number of data increments the cluster is allowed to range over. Larger d results in clusters over larger scales.
+        engine (str): "array" (default) grows regions with vectorized floods over flat pixel indices. "legacy" uses
+            the original pixel-by-pixel implementation. Both produce identical labels.
+        sparse (bool): If True and the array engine is used, only segment the areas around regions above
+            min_intensity. The objects are identical, but they are numbered region by region.
     """
 
-    def __init__(self, min_intensity, data_increment, max_intensity, size_threshold_pixels, delta):
+    def __init__(self, min_intensity, data_increment, max_intensity, size_threshold_pixels, delta, engine="array",
+                 sparse=False):
         self.min_intensity = min_intensity
         self.data_increment = data_increment
         self.max_intensity = max_intensity
         self.max_size = size_threshold_pixels
         self.delta = delta
         self.max_bin = int((self.max_intensity - self.min_intensity) / self.data_increment)
+        if engine not in ["array", "legacy"]:
+            raise ValueError("engine must be 'array' or 'legacy', not {0}".format(engine))
+        self.engine = engine
+        self.sparse = sparse
         self.UNMARKED = -1
+        self.BORDER = -2
         self.GLOBBED = -3
         self.TOOSMALL = -4
 
@@ -51,9 +63,18 @@ class EnhancedWatershed(object):
         Returns:
             Array of labeled pixels
         """
-        pixels, q_data = self.quantize(input_grid)
-        centers = self.find_local_maxima(pixels, q_data)
-        marked = self.grow_centers(centers, q_data)
+        # The flat engine needs at least 3 rows and columns to reproduce the slicing behavior of the legacy engine.
+        if self.engine == "array" and min(np.shape(input_grid)) > 2:
+            if self.sparse:
+                marked = self.grow_regions_sparse(self.quantize_data(input_grid))
+            else:
+                flood_grid = FloodGrid(*self.quantize(input_grid))
+                centers = self.find_local_maxima_flat(flood_grid)
+                marked = self.grow_centers_flat(centers, flood_grid)
+        else:
+            q_data, pixel_order, bin_starts = self.quantize(input_grid)
+            centers = self.find_local_maxima(pixel_order, bin_starts, q_data)
+            marked = self.grow_centers(centers, q_data)
         if only_objects:
             marked = np.where(marked > 0, marked, 0)
         return marked
@@ -69,30 +90,22 @@ class EnhancedWatershed(object):
         Returns:
             Labeled array with re-numbered objects to account for those that have been removed
         """
-        out_grid = np.zeros(labeled_grid.shape, dtype=int)
-        slices = find_objects(labeled_grid)
-        j = 1
-        for i, s in enumerate(slices):
-            box = labeled_grid[s]
-            size = np.count_nonzero(box == i + 1)
-            if size >= min_size and box.shape[0] > 1 and box.shape[1] > 1:
-                out_grid[np.where(labeled_grid == i + 1)] = j
-                j += 1
-        return out_grid
+        return size_filter(labeled_grid, min_size)
 
-    def find_local_maxima(self, pixels, q_data):
+    def find_local_maxima(self, pixel_order, bin_starts, q_data):
         """
         Finds the local maxima in the inputGrid and perform region growing to identify objects.
 
         Args:
-            pixels: dictionary of quantized pixel values
+            pixel_order: flat indices of the valid pixels sorted by bin
+            bin_starts: position in pixel_order of the first pixel of each bin
             q_data: 2D array representation of quantized input data
         Returns:
             array with labeled objects.
         """
         centers = OrderedDict()
-        for p in pixels.keys():
-            centers[p] = []
+        for b in range(self.max_bin + 1):
+            centers[b] = []
         marked = np.ones(q_data.shape, dtype=np.int32) * self.UNMARKED
         MIN_INFL = int(np.round(1 + 0.5 * np.sqrt(self.max_size)))
         MAX_INFL = 2 * MIN_INFL
@@ -102,10 +115,11 @@ class EnhancedWatershed(object):
         # Work from high to low bins. The pixels in the highest bin mark their
         # neighborhoods first. If you did it from low to high the lowest maxima
         # would mark their neighborhoods first and interfere with the identification of higher maxima.
-        for b in sorted(pixels.keys(), reverse=True):
+        for b in range(self.max_bin, -1, -1):
             # Square starts large with high intensity bins and gets smaller with low intensity bins.
             infl_dist = MIN_INFL + int(np.round(float(b) / self.max_bin * (MAX_INFL - MIN_INFL)))
-            for p in pixels[b]:
+            rows, cols = np.unravel_index(pixel_order[bin_starts[b]:bin_starts[b + 1]], q_data.shape)
+            for p in zip(rows.tolist(), cols.tolist()):
                 if marked[p] == self.UNMARKED:
                     ok = False
                     del marked_so_far[:]
@@ -271,6 +285,228 @@ class EnhancedWatershed(object):
                             hills.append(index)
         del foothills[:]
 
+    def find_local_maxima_flat(self, flood_grid):
+        """
+        Array engine version of find_local_maxima. Pixels are visited in the same order as the legacy engine, but each
+        region of influence is checked and marked with a single array operation.
+
+        Args:
+            flood_grid: FloodGrid containing the quantized data
+        Returns:
+            OrderedDict of center pixel indices in the padded FloodGrid for each bin.
+        """
+        centers = OrderedDict()
+        for b in range(self.max_bin + 1):
+            centers[b] = []
+        marked = np.ones(flood_grid.shape, dtype=np.int32) * self.UNMARKED
+        width = flood_grid.shape[1]
+        MIN_INFL = int(np.round(1 + 0.5 * np.sqrt(self.max_size)))
+        MAX_INFL = 2 * MIN_INFL
+        for b in range(self.max_bin, -1, -1):
+            infl_dist = MIN_INFL + int(np.round(float(b) / self.max_bin * (MAX_INFL - MIN_INFL)))
+            for p in flood_grid.bin_pixels(b).tolist():
+                i, j = divmod(p, width)
+                if marked[i, j] == self.UNMARKED:
+                    # Slicing (including negative starts near the edges) matches the legacy engine.
+                    window = marked[i - infl_dist:i + infl_dist + 1, j - infl_dist:j + infl_dist + 1]
+                    if window.size > 0 and np.all(window == self.UNMARKED):
+                        window[:] = b
+                        centers[b].append(flood_grid.padded_index(i, j))
+        return centers
+
+    def grow_centers_flat(self, centers, flood_grid, center_index=None):
+        """
+        Array engine version of grow_centers. Centers are visited in the same order as the legacy engine.
+
+        Args:
+            centers: OrderedDict of center pixel indices from find_local_maxima_flat
+            flood_grid: FloodGrid containing the quantized data
+            center_index: CenterIndex of all centers used to decide which center is closest to a foothill. Defaults to
+                an index of centers.
+
+        Returns:
+            Array of marked pixels with the same shape as the input grid.
+        """
+        return self.grow_centers_deltas(centers, flood_grid, [self.delta], center_index)[self.delta]
+
+    def grow_centers_deltas(self, centers, flood_grid, deltas, center_index=None):
+        """
+        Grow centers with the array engine for several values of delta at once. Each pass over the bins does not
+        depend on delta, so the regions grown with a smaller delta are the regions found partway through growing
+        with a larger delta.
+
+        Args:
+            centers: OrderedDict of center pixel indices from find_local_maxima_flat
+            flood_grid: FloodGrid containing the quantized data
+            deltas: list of delta values
+            center_index: CenterIndex of all centers used to decide which center is closest to a foothill. Defaults to
+                an index of centers.
+
+        Returns:
+            dict of the array of marked pixels for each delta.
+        """
+        marked = flood_grid.marker_grid(self.UNMARKED, self.BORDER)
+        if center_index is None:
+            center_index = CenterIndex(flood_grid.center_coordinates(centers))
+        deferred_from_last = []
+        deferred_to_next = []
+        center_keys = np.array(list(centers.keys()))[::-1]
+        capture_index = 1
+        foothills = []
+        marked_deltas = {}
+        for diff in range(0, max(deltas) + 1):
+            for b in center_keys:
+                bin_lower = b - diff
+                deferred_from_last[:] = deferred_to_next[:]
+                del deferred_to_next[:]
+                for center in deferred_from_last + centers[b]:
+                    if bin_lower < 0:
+                        bin_lower = 0
+                    if marked[center] == self.UNMARKED:
+                        captured = self.set_maximum_flat(flood_grid, marked, center, bin_lower, foothills,
+                                                         capture_index)
+                        if not captured:
+                            deferred_to_next.append(center)
+                        else:
+                            capture_index += 1
+                self.remove_foothills_flat(flood_grid, marked, b, bin_lower, center_index, foothills)
+            del deferred_from_last[:]
+            del deferred_to_next[:]
+            if diff in deltas:
+                marked_deltas[diff] = flood_grid.unpad(marked)
+        return marked_deltas
+
+    def grow_regions_sparse(self, q_data):
+        """
+        Segment only the boxes surrounding groups of pixels above min_intensity. Regions closer together than the
+        largest region of influence could compete for local maxima, so they are segmented together, and each box is
+        padded by the largest region of influence so that no local maximum search reaches its edge. All local maxima
+        are found before any region is grown because foothills check the distance to every center in the domain.
+        The result is identical to segmenting the whole grid except that objects are numbered box by box.
+        Grids smaller than two regions of influence are segmented in full.
+
+        Args:
+            q_data: Quantized 2D array from quantize_data
+
+        Returns:
+            Array of marked pixels with the same shape as q_data.
+        """
+        max_infl = 2 * int(np.round(1 + 0.5 * np.sqrt(self.max_size)))
+        if min(q_data.shape) < 2 * max_infl + 1:
+            flood_grid = FloodGrid(q_data, *self.sort_pixels(q_data))
+            return self.grow_centers_flat(self.find_local_maxima_flat(flood_grid), flood_grid)
+        marked = np.ones(q_data.shape, dtype=np.int32) * self.UNMARKED
+        valid = q_data >= 0
+        if not np.any(valid):
+            return marked
+        groups = label(maximum_filter(valid, size=2 * max_infl + 1, mode="constant"), structure=np.ones((3, 3)))[0]
+        boxes = []
+        center_coords = OrderedDict()
+        for b in range(self.max_bin + 1):
+            center_coords[b] = []
+        for g, group_slice in enumerate(find_objects(np.where(valid, groups, 0))):
+            if group_slice is None:
+                continue
+            # Boxes starting at the edge of the grid are kept at least as wide as a region of influence so that
+            # negative slices wrap to unmarked pixels, as they do in the full grid.
+            box = tuple([slice(max(s.start - max_infl, 0),
+                               min(max(s.stop + max_infl, 2 * max_infl + 1), q_data.shape[d]))
+                         for d, s in enumerate(group_slice)])
+            box_data = np.where(groups[box] == g + 1, q_data[box], -1)
+            flood_grid = FloodGrid(box_data, *self.sort_pixels(box_data), corner=(box[0].start, box[1].start))
+            centers = self.find_local_maxima_flat(flood_grid)
+            for b, coords in flood_grid.center_coordinates(centers).items():
+                center_coords[b].append(coords)
+            boxes.append((box, flood_grid, centers))
+        for b in center_coords.keys():
+            center_coords[b] = np.concatenate(center_coords[b])
+        center_index = CenterIndex(center_coords)
+        num_objects = 0
+        for box, flood_grid, centers in boxes:
+            box_marked = self.grow_centers_flat(centers, flood_grid, center_index)
+            changed = box_marked != self.UNMARKED
+            box_marked[box_marked > 0] += num_objects
+            marked[box][changed] = box_marked[changed]
+            num_objects = max(num_objects, box_marked.max())
+        return marked
+
+    def set_maximum_flat(self, flood_grid, marked, center, bin_lower, foothills, capture_index):
+        """
+        Array engine version of set_maximum. The region is grown one frontier at a time instead of one pixel at a
+        time, which marks the same set of pixels because the legacy flood does not depend on visiting order.
+
+        Args:
+            flood_grid: FloodGrid containing the quantized data
+            marked: Flat padded array marking points that are objects
+            center: Padded index of the center pixel of the region being grown
+            bin_lower: Intensity level of lower bin being evaluated
+            foothills: List of (center, pixel array) tuples to be globbed.
+            capture_index: Label assigned to the region if it is captured.
+        Returns:
+            True if the object is finished growing and False if the object should be grown again at the next
+            threshold level.
+        """
+        q_data = flood_grid.q_data
+        center_data = q_data[center]
+        marked[center] = capture_index
+        frontier = np.array([center], dtype=np.int64)
+        marked_so_far = [frontier]
+        as_glob = []
+        will_be_considered_again = False
+        while frontier.size > 0:
+            neighbors = flood_grid.neighbors(frontier)
+            neighbors = np.unique(neighbors[marked[neighbors] == self.UNMARKED])
+            n_data = q_data[neighbors]
+            if not will_be_considered_again:
+                will_be_considered_again = np.any((n_data >= 0) & (n_data < center_data))
+            frontier = neighbors[n_data >= bin_lower]
+            marked[frontier] = capture_index
+            marked_so_far.append(frontier)
+            as_glob.append(neighbors[(n_data >= 0) & (n_data < bin_lower)])
+        if bin_lower == 0:
+            will_be_considered_again = False
+        marked_so_far = np.concatenate(marked_so_far)
+        big_enough = marked_so_far.size >= self.max_size
+        if big_enough:
+            foothills.append((center, np.unique(np.concatenate(as_glob))))
+        elif will_be_considered_again:
+            marked[marked_so_far] = self.UNMARKED
+        return big_enough or (not will_be_considered_again)
+
+    def remove_foothills_flat(self, flood_grid, marked, bin_num, bin_lower, center_index, foothills):
+        """
+        Array engine version of remove_foothills.
+
+        Args:
+            flood_grid: FloodGrid containing the quantized data
+            marked: Flat padded array marking points that are objects
+            bin_num: Current bin being searched
+            bin_lower: Next bin being searched
+            center_index: CenterIndex of the centers
+            foothills: List of foothill points being removed.
+        """
+        q_data = flood_grid.q_data
+        for center, hills in foothills:
+            marked[hills] = self.GLOBBED
+            while hills.size > 0:
+                neighbors, sources = flood_grid.neighbors(hills, return_sources=True)
+                unmarked = marked[neighbors] == self.UNMARKED
+                neighbors = neighbors[unmarked]
+                sources = sources[unmarked]
+                n_data = q_data[neighbors]
+                lower = (n_data >= 0) & (n_data < bin_lower)
+                neighbors = neighbors[lower]
+                downhill = n_data[lower] <= q_data[sources[lower]]
+                if not np.all(downhill):
+                    uphill = np.unique(neighbors[~downhill])
+                    closest = center_index.is_closest(flood_grid.coordinates(uphill),
+                                                      flood_grid.coordinates(np.array([center]))[0], bin_num)
+                    hills = np.union1d(neighbors[downhill], uphill[closest])
+                else:
+                    hills = np.unique(neighbors)
+                marked[hills] = self.GLOBBED
+        del foothills[:]
+
     @staticmethod
     def is_closest(point, center, centers, bin_num):
         bin_thresh = int(bin_num / 2)
@@ -292,25 +528,229 @@ class EnhancedWatershed(object):
             input_grid: 2-d array of values
 
         Returns:
-            Dictionary of value pointing to pixel locations, and quantized 2-d array of data
+            Quantized 2-d array of data, flat indices of the valid pixels sorted by bin, and the position in the
+            sorted indices of the first pixel of each bin
+        """
+        data = self.quantize_data(input_grid)
+        pixel_order, bin_starts = self.sort_pixels(data)
+        return data, pixel_order, bin_starts
+
+    def sort_pixels(self, q_data):
         """
-        pixels = dict()
-        for i in range(self.max_bin + 1):
-            pixels[i] = []
+        Sort the valid pixels of a quantized grid by bin. Pixels within a bin stay in row-major order.
+
+        Args:
+            q_data: Quantized 2-d array of data
 
+        Returns:
+            Flat indices of the valid pixels sorted by bin, and an array of length max_bin + 2 containing the position
+            of the first pixel of each bin, so that the pixels in bin b are pixel_order[bin_starts[b]:bin_starts[b + 1]]
+        """
+        flat_data = q_data.ravel()
+        valid = np.flatnonzero(flat_data >= 0)
+        pixel_order = valid[np.argsort(flat_data[valid], kind="stable")]
+        bin_starts = np.zeros(self.max_bin + 2, dtype=np.int64)
+        bin_starts[1:] = np.cumsum(np.bincount(flat_data[valid], minlength=self.max_bin + 1))
+        return pixel_order, bin_starts
+
+    def quantize_data(self, input_grid):
+        """
+        Quantize a grid into discrete bins. Pixels below min_intensity are assigned to bin -1.
+
+        Args:
+            input_grid: 2-d array of values
+
+        Returns:
+            Quantized 2-d array of data
+        """
         data = (np.array(input_grid, dtype=np.int32) - self.min_intensity) // self.data_increment
         data[data < 0] = -1
         data[data > self.max_bin] = self.max_bin
-        good_points = np.where(data >= 0)
-        for g in np.arange(good_points[0].shape[0]):
-            pixels[data[(good_points[0][g], good_points[1][g])]].append((good_points[0][g], good_points[1][g]))
-        return pixels, data
+        return data
 
     @staticmethod
     def is_valid(point, shape):
         return np.all((np.array(point) >= 0) & (np.array(shape) - np.array(point) > 0))
 
 
+def sweep_labels(input_grid, param_sets, data_range=None, only_objects=True):
+    """
+    Label one grid with the enhanced watershed for many sets of parameters. Intermediate products are computed once
+    and shared among the parameter sets that produce them: the rescaled grid, the quantized grid for each
+    min_intensity, data_increment, and max_intensity, the local maxima for each quantized grid and
+    size_threshold_pixels, and the grown regions for every delta, since growing with a smaller delta is the first
+    part of growing with a larger one.
+
+    Args:
+        input_grid: 2D array being labeled
+        param_sets: list of EnhancedWatershed arguments for each labeling. Each set can be a tuple of
+            (min_intensity, data_increment, max_intensity, size_threshold_pixels, delta) or a dict of keyword arguments.
+        data_range: If not None, the (data_min, data_max) used to rescale input_grid with rescale_data before labeling.
+        only_objects (bool): Only return object pixel values on final grid
+
+    Returns:
+        List of labeled arrays in the same order as param_sets.
+    """
+    if data_range is not None:
+        input_grid = rescale_data(input_grid, data_range[0], data_range[1])
+    watersheds = []
+    for params in param_sets:
+        if isinstance(params, dict):
+            watersheds.append(EnhancedWatershed(**params))
+        else:
+            watersheds.append(EnhancedWatershed(*params))
+    labels = [None] * len(watersheds)
+    if min(np.shape(input_grid)) <= 2:
+        for w, ew in enumerate(watersheds):
+            labels[w] = ew.label(input_grid, only_objects=only_objects)
+        return labels
+    maxima_groups = OrderedDict()
+    for w, ew in enumerate(watersheds):
+        maxima_key = (ew.min_intensity, ew.data_increment, ew.max_intensity, ew.max_size)
+        if maxima_key not in maxima_groups.keys():
+            maxima_groups[maxima_key] = []
+        maxima_groups[maxima_key].append(w)
+    quantize_key = None
+    flood_grid = None
+    for maxima_key in sorted(maxima_groups.keys()):
+        group = maxima_groups[maxima_key]
+        ew = watersheds[group[0]]
+        if maxima_key[:3] != quantize_key:
+            quantize_key = maxima_key[:3]
+            flood_grid = FloodGrid(*ew.quantize(input_grid))
+        centers = ew.find_local_maxima_flat(flood_grid)
+        marked_deltas = ew.grow_centers_deltas(centers, flood_grid, sorted(set([watersheds[w].delta for w in group])))
+        for w in group:
+            if only_objects:
+                labels[w] = np.where(marked_deltas[watersheds[w].delta] > 0, marked_deltas[watersheds[w].delta], 0)
+            else:
+                labels[w] = marked_deltas[watersheds[w].delta].copy()
+    return labels
+
+
+class FloodGrid(object):
+    """
+    Flat, padded representation of a quantized grid used by the array engine of EnhancedWatershed. The grid is padded
+    by one pixel of invalid data on each side so that the 3x3 neighbors of every pixel can be found with fixed
+    offsets. Pixels in the first row or column of the original grid do not search their neighbors, which matches the
+    negative slice indexing of the legacy engine.
+
+    Attributes:
+        shape: shape of the original grid
+        corner: row and column of the first pixel of the grid within a larger domain
+        q_data: flattened, padded quantized data
+        pixel_order: indices of valid pixels in the original grid sorted by bin from EnhancedWatershed.sort_pixels
+        bin_starts: position in pixel_order of the first pixel of each bin
+    """
+    def __init__(self, q_data, pixel_order, bin_starts, corner=(0, 0)):
+        self.shape = q_data.shape
+        self.corner = np.array(corner, dtype=np.int64)
+        self.padded_shape = (q_data.shape[0] + 2, q_data.shape[1] + 2)
+        width = self.padded_shape[1]
+        self.q_data = np.pad(q_data, 1, "constant", constant_values=-1).ravel()
+        expands = np.zeros(self.padded_shape, dtype=bool)
+        expands[2:-1, 2:-1] = True
+        self.expands = expands.ravel()
+        self.offsets = np.array([-width - 1, -width, -width + 1, -1, 0, 1, width - 1, width, width + 1],
+                                dtype=np.int64)
+        self.pixel_order = pixel_order
+        self.bin_starts = bin_starts
+
+    def bin_pixels(self, b):
+        """
+        Indices of the pixels in the original grid within bin b in row-major order.
+        """
+        return self.pixel_order[self.bin_starts[b]:self.bin_starts[b + 1]]
+
+    def padded_index(self, i, j):
+        return (i + 1) * self.padded_shape[1] + j + 1
+
+    def coordinates(self, indices):
+        """
+        Convert padded indices to an (n, 2) array of row and column coordinates in the domain containing the grid.
+        """
+        rows, cols = np.divmod(indices, self.padded_shape[1])
+        return np.stack([rows - 1, cols - 1], axis=-1) + self.corner
+
+    def center_coordinates(self, centers):
+        """
+        Convert an OrderedDict of padded center indices in each bin to an OrderedDict of coordinate arrays.
+        """
+        center_coords = OrderedDict()
+        for b, bin_centers in centers.items():
+            center_coords[b] = self.coordinates(np.array(bin_centers, dtype=np.int64))
+        return center_coords
+
+    def marker_grid(self, unmarked, border):
+        marked = np.ones(self.padded_shape, dtype=np.int32) * border
+        marked[1:-1, 1:-1] = unmarked
+        return marked.ravel()
+
+    def unpad(self, flat_grid):
+        return flat_grid.reshape(self.padded_shape)[1:-1, 1:-1].copy()
+
+    def neighbors(self, indices, return_sources=False):
+        """
+        Find the 3x3 neighborhood of each pixel that searches its neighbors.
+
+        Args:
+            indices: array of padded indices
+            return_sources: If True, also return the pixel each neighbor was found from.
+
+        Returns:
+            Array of neighbor indices, and optionally the source of each neighbor.
+        """
+        sources = indices[self.expands[indices]]
+        neighbors = (sources[:, np.newaxis] + self.offsets).ravel()
+        if return_sources:
+            return neighbors, np.repeat(sources, self.offsets.size)
+        return neighbors
+
+
+class CenterIndex(object):
+    """
+    KD-tree index of the centers found by the array engine of EnhancedWatershed, used to check whether a foothill
+    pixel is closer to another center than to the center that owns it. Only centers in bins at or above half of the
+    current bin are compared, so the centers are stored from the highest to the lowest bin and a tree is built the
+    first time each prefix of them is queried. Regions grow from high to low bins, so the prefix only gets longer.
+
+    Attributes:
+        coords: (n, 2) array of center coordinates sorted from the highest to the lowest bin
+        num_eligible: number of centers in each bin or higher
+        trees: cKDTree for each prefix length that has been queried
+    """
+    def __init__(self, center_coords):
+        bins = sorted(center_coords.keys(), reverse=True)
+        coords = [np.reshape(center_coords[b], (-1, 2)) for b in bins]
+        self.coords = np.concatenate(coords).astype(np.int64)
+        self.num_eligible = np.zeros(len(bins), dtype=int)
+        self.num_eligible[bins] = np.cumsum([c.shape[0] for c in coords])
+        self.trees = dict()
+
+    def is_closest(self, points, center, bin_num):
+        """
+        Check whether each point is no closer to any center in bins at or above int(bin_num / 2) than to center. The
+        nearest center from the tree is checked again with integer squared distances, so ties are resolved the same
+        way as EnhancedWatershed.is_closest.
+
+        Args:
+            points: (n, 2) array of row and column coordinates
+            center: row and column of the center that owns the points
+            bin_num: Current bin being searched
+
+        Returns:
+            Boolean array that is True for each point that is no closer to any other center than to center.
+        """
+        num_centers = self.num_eligible[int(bin_num / 2)]
+        if num_centers == 0:
+            return np.ones(points.shape[0], dtype=bool)
+        if num_centers not in self.trees.keys():
+            self.trees[num_centers] = cKDTree(self.coords[:num_centers])
+        nearest = self.trees[num_centers].query(points)[1]
+        my_dist = np.sum((points - center) ** 2, axis=1)
+        return np.sum((points - self.coords[nearest]) ** 2, axis=1) >= my_dist
+
+
 def rescale_data(data, data_min, data_max, out_min=0.0, out_max=100.0):
     """
     Rescale your input data so that is ranges over integer values, which will perform better in the watershed.
@@ -0,0 +1,269 @@
+import numpy as np
+import json
+import re
+from .STObject import STObject
+
+WHITESPACE = re.compile(rb"\s*")
+STRING = re.compile(rb'"(?:[^"\\]|\\.)*"')
+SCALAR_END = re.compile(rb"[,\]}\s]")
+STEP_ARRAYS = ["timesteps", "masks", "x", "y", "i", "j"]
+
+
+class GeoJSONTrack(object):
+    """
+    Lazy reader for geoJSON files created by STObject.to_geojson. The file is scanned once to find where each value
+    is stored, but only the top-level properties are parsed. Values in the features, such as the masks, coordinates,
+    and attribute grids of each timestep, are read from the file and parsed when they are requested.
+
+    Args:
+        filename: Name of the geoJSON file
+
+    Attributes:
+        properties: dict of the top-level properties, including the times, motion, and metadata of the track.
+        times: Array of the times of each feature
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as json_file:
+            scanner = JSONScanner(json_file.read())
+        top_level = scanner.scan_object(WHITESPACE.match(scanner.text).end())
+        self.properties = json.loads(scanner.text[slice(*top_level["properties"])])
+        self.times = np.array(self.properties["times"])
+        self.feature_spans = []
+        self.attribute_spans = []
+        self.geometry_spans = []
+        for start, end in scanner.scan_array(top_level["features"][0]):
+            feature = scanner.scan_object(start)
+            self.feature_spans.append(scanner.scan_object(feature["properties"][0]))
+            self.geometry_spans.append(feature["geometry"])
+            if "attributes" in self.feature_spans[-1].keys():
+                self.attribute_spans.append(scanner.scan_object(self.feature_spans[-1]["attributes"][0]))
+            else:
+                self.attribute_spans.append({})
+
+    def __len__(self):
+        return len(self.feature_spans)
+
+    def read_values(self, spans):
+        """
+        Read and parse JSON values from the file.
+
+        Args:
+            spans: List of (start, end) byte positions of each value
+
+        Returns:
+            List of the parsed values
+        """
+        values = []
+        with open(self.filename, "rb") as json_file:
+            for start, end in spans:
+                json_file.seek(start)
+                values.append(json.loads(json_file.read(end - start)))
+        return values
+
+    def feature_property(self, index, name):
+        """
+        Read one property of a feature.
+
+        Args:
+            index: Index of the feature
+            name: Name of the property, such as "masks" or the name of a forecast.
+
+        Returns:
+            The parsed value of the property
+        """
+        return self.read_values([self.feature_spans[index][name]])[0]
+
+    def feature_properties(self, name):
+        """
+        Read one property of every feature.
+
+        Args:
+            name: Name of the property
+
+        Returns:
+            List of the parsed values
+        """
+        return self.read_values([spans[name] for spans in self.feature_spans])
+
+    def property_names(self, index=0):
+        """
+        Get the names of the properties of a feature.
+
+        Args:
+            index: Index of the feature
+
+        Returns:
+            List of property names
+        """
+        return list(self.feature_spans[index].keys())
+
+    def geometry(self, index):
+        """
+        Read the geometry of a feature.
+
+        Args:
+            index: Index of the feature
+
+        Returns:
+            dict containing the geoJSON geometry
+        """
+        return self.read_values([self.geometry_spans[index]])[0]
+
+    def step_arrays(self, name):
+        """
+        Read one of the timesteps, masks, x, y, i, or j arrays of every feature.
+
+        Args:
+            name: Name of the array
+
+        Returns:
+            List of numpy arrays
+        """
+        return [np.array(value) for value in self.feature_properties(name)]
+
+    def attribute_names(self):
+        """
+        Get the names of the attributes of the track.
+
+        Returns:
+            List of attribute names
+        """
+        if len(self) == 0:
+            return []
+        return list(self.attribute_spans[0].keys())
+
+    def attribute(self, name):
+        """
+        Read one attribute grid of every feature without parsing the other attributes.
+
+        Args:
+            name: Name of the attribute
+
+        Returns:
+            List of numpy arrays
+        """
+        return [np.array(value) for value in self.read_values([spans[name] for spans in self.attribute_spans])]
+
+    def to_stobject(self, attributes=None):
+        """
+        Create an STObject from the track.
+
+        Args:
+            attributes: List of attribute names to read. All attributes are read if None.
+
+        Returns:
+            an STObject
+        """
+        kwargs = {}
+        for kw in ["dx", "step", "u", "v"]:
+            if kw in self.properties.keys():
+                kwargs[kw] = self.properties[kw]
+        sto = STObject(*[self.step_arrays(name) for name in STEP_ARRAYS],
+                       self.properties["times"][0], self.properties["times"][-1], **kwargs)
+        if attributes is None:
+            attributes = self.attribute_names()
+        for attribute in attributes:
+            sto.attributes[attribute] = self.attribute(attribute)
+        return sto
+
+
+class JSONScanner(object):
+    """
+    Finds the positions of JSON values in a byte string without parsing them. The positions and nesting depths of the
+    brackets and braces outside of strings are found once with numpy, so the end of an array or object of any size is
+    found with a binary search instead of reading its contents.
+
+    Args:
+        text: bytes containing JSON
+    """
+    def __init__(self, text):
+        self.text = text
+        chars = np.frombuffer(text, dtype=np.uint8)
+        positions = np.flatnonzero((chars == ord("[")) | (chars == ord("]")) | (chars == ord("{")) |
+                                   (chars == ord("}")) | (chars == ord('"')))
+        tokens = chars[positions]
+        quotes = np.flatnonzero(tokens == ord('"'))
+        for q in quotes[chars[np.maximum(positions[quotes] - 1, 0)] == ord("\\")]:
+            # A quote is escaped if it follows an odd number of backslashes.
+            p = positions[q] - 1
+            while p >= 0 and chars[p] == ord("\\"):
+                p -= 1
+            if (positions[q] - 1 - p) % 2 == 1:
+                tokens[q] = 0
+        in_string = np.cumsum(tokens == ord('"')) % 2 == 1
+        structural = ~in_string & (tokens != ord('"')) & (tokens != 0)
+        self.positions = positions[structural]
+        steps = np.where((tokens[structural] == ord("[")) | (tokens[structural] == ord("{")), 1, -1)
+        self.depths = np.cumsum(steps)
+        closers = np.flatnonzero(steps < 0)
+        order = np.lexsort((self.positions[closers], self.depths[closers]))
+        self.closer_positions = self.positions[closers][order]
+        self.depth_starts = np.searchsorted(self.depths[closers][order], np.arange(self.depths.max(initial=0) + 2))
+
+    def skip_value(self, pos):
+        """
+        Find the end of the JSON value starting at pos without parsing it.
+
+        Args:
+            pos: Position of the first character of the value
+
+        Returns:
+            Position after the end of the value
+        """
+        first = self.text[pos:pos + 1]
+        if first == b'"':
+            return STRING.match(self.text, pos).end()
+        if first not in (b"[", b"{"):
+            scalar_end = SCALAR_END.search(self.text, pos)
+            return len(self.text) if scalar_end is None else scalar_end.start()
+        # The matching closer is the first one after pos that returns to the depth outside of the value.
+        level = self.depths[np.searchsorted(self.positions, pos)] - 1
+        level_closers = self.closer_positions[self.depth_starts[level]:self.depth_starts[level + 1]]
+        return level_closers[np.searchsorted(level_closers, pos)] + 1
+
+    def scan_object(self, pos):
+        """
+        Find the position of each value in a JSON object without parsing the values.
+
+        Args:
+            pos: Position of the opening brace
+
+        Returns:
+            dict of the (start, end) positions of the value of each key
+        """
+        text = self.text
+        spans = {}
+        pos = WHITESPACE.match(text, pos + 1).end()
+        while text[pos:pos + 1] != b"}":
+            key_end = STRING.match(text, pos).end()
+            key = json.loads(text[pos:key_end])
+            pos = WHITESPACE.match(text, key_end).end() + 1
+            start = WHITESPACE.match(text, pos).end()
+            end = self.skip_value(start)
+            spans[key] = (start, end)
+            pos = WHITESPACE.match(text, end).end()
+            if text[pos:pos + 1] == b",":
+                pos = WHITESPACE.match(text, pos + 1).end()
+        return spans
+
+    def scan_array(self, pos):
+        """
+        Find the position of each value in a JSON array without parsing the values.
+
+        Args:
+            pos: Position of the opening bracket
+
+        Returns:
+            List of the (start, end) positions of each value
+        """
+        text = self.text
+        spans = []
+        pos = WHITESPACE.match(text, pos + 1).end()
+        while text[pos:pos + 1] != b"]":
+            end = self.skip_value(pos)
+            spans.append((pos, end))
+            pos = WHITESPACE.match(text, end).end()
+            if text[pos:pos + 1] == b",":
+                pos = WHITESPACE.match(text, pos + 1).end()
+        return spans
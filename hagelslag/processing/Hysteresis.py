@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.ndimage import label, maximum, find_objects
+from scipy.ndimage import label, maximum
+from .size_filter import size_filter
 
 
 class Hysteresis(object):
@@ -19,7 +20,9 @@ class Hysteresis(object):
 
     def label(self, input_grid):
         """
-        Label input grid with hysteresis method.
+        Label input grid with hysteresis method. Objects are the 8-connected regions above min_intensity that contain
+        a region above max_intensity, and each object is numbered with the label of the region above max_intensity
+        that has the largest value. The high threshold is assumed to be at least as large as the low threshold.
 
         Args:
             input_grid: 2D array of values.
@@ -27,26 +30,20 @@ class Hysteresis(object):
         Returns:
             Labeled output grid.
         """
-        unset = 0
         high_labels, num_labels = label(input_grid > self.max_intensity)
+        if num_labels == 0:
+            return np.zeros(input_grid.shape, dtype=int)
         region_ranking = np.argsort(maximum(input_grid, high_labels, index=np.arange(1, num_labels + 1)))[::-1]
-        output_grid = np.zeros(input_grid.shape, dtype=int)
-        stack = []
-        for rank in region_ranking:
-            label_num = rank + 1
-            label_i, label_j = np.where(high_labels == label_num)
-            for i in range(label_i.size):
-                if output_grid[label_i[i], label_j[i]] == unset:
-                    stack.append((label_i[i], label_j[i]))
-            while len(stack) > 0:
-                index = stack.pop(-1)
-                output_grid[index] = label_num
-                for i in range(index[0] - 1, index[0] + 2):
-                    for j in range(index[1] - 1, index[1] + 2):
-                        if 0 <= i < output_grid.shape[0] and 0 <= j < output_grid.shape[1]:
-                            if (input_grid[i, j] > self.min_intensity) and (output_grid[i, j] == unset):
-                                stack.append((i, j))
-        return output_grid
+        # Objects grow from the high threshold regions through all 8-connected pixels above the low threshold.
+        low_labels, num_low_labels = label(input_grid > self.min_intensity, structure=np.ones((3, 3)))
+        high_low_labels = maximum(low_labels, high_labels, index=np.arange(1, num_labels + 1)).astype(int)
+        # Each low threshold region takes the label of its high threshold region with the largest maximum.
+        ranked_low_labels = high_low_labels[region_ranking]
+        unique_low_labels, first_ranks = np.unique(ranked_low_labels, return_index=True)
+        low_to_output = np.zeros(num_low_labels + 1, dtype=int)
+        low_to_output[unique_low_labels] = region_ranking[first_ranks] + 1
+        low_to_output[0] = 0
+        return low_to_output[low_labels]
 
     @staticmethod
     def size_filter(labeled_grid, min_size):
@@ -60,13 +57,4 @@ class Hysteresis(object):
         Returns:
             labeled grid with smaller objects removed.
         """
-        out_grid = np.zeros(labeled_grid.shape, dtype=int)
-        slices = find_objects(labeled_grid)
-        j = 1
-        for i, s in enumerate(slices):
-            box = labeled_grid[s]
-            size = np.count_nonzero(box.ravel() == (i + 1))
-            if size >= min_size and box.shape[0] > 1 and box.shape[1] > 1:
-                out_grid[np.where(labeled_grid == i + 1)] = j
-                j += 1
-        return out_grid
+        return size_filter(labeled_grid, min_size)
@@ -0,0 +1,180 @@
+import numpy as np
+from netCDF4 import Dataset
+from os import replace
+from os.path import exists, splitext
+from .tracker import label_storm_objects, extract_storm_objects, track_storms
+from .TrackFile import write_track_file, TrackFile
+
+
+class IncrementalTracker(object):
+    """
+    Segments and tracks storms one time slice at a time, such as each forecast hour as it is written by a real-time
+    model run. Each slice is labeled with label_storm_objects, extracted with extract_storm_objects, and matched
+    against the tracks that ended at the previous slice with track_storms, which gives the same tracks as labeling and
+    tracking all times at once. After each slice, the active tracks and the previous slice are written to a checkpoint
+    file so a restarted process resumes from the last slice that was added. Tracks that finish at a slice are written
+    once to their own track file, so the cost of each checkpoint does not grow with the number of finished tracks.
+
+    Args:
+        method: Labeling method passed to label_storm_objects ("ew", "ws", or "hyst")
+        min_intensity: Minimum intensity threshold passed to label_storm_objects
+        max_intensity: Maximum intensity threshold passed to label_storm_objects
+        x_grid: 2D array of x-coordinates
+        y_grid: 2D array of y-coordinates
+        distance_components: list of function objects that make up components of distance function
+        distance_maxima: array of maximum values for each distance for normalization purposes
+        distance_weights: weight given to each component of the distance function. Should add to 1.
+        dx: grid spacing in same units as x_grid and y_grid.
+        dt: period elapsed between times
+        obj_buffer: number of extra pixels beyond bounding box of object to store in each STObject
+        label_kwargs: dict of other keyword arguments for label_storm_objects, such as min_area or gaussian_sd.
+        checkpoint_file: Name of the netCDF4 file storing the tracker state. If it exists, the state is loaded from it.
+            The tracks finished at each time are stored next to it in files named by finished_file.
+
+    Attributes:
+        tracked_objects: List of all tracks in the order they were started.
+        active_tracks: Tracks that ended at the last time and can be extended by the next time slice.
+        last_time: Last time added, or None if no times have been added.
+    """
+    def __init__(self, method, min_intensity, max_intensity, x_grid, y_grid, distance_components, distance_maxima,
+                 distance_weights, dx=1, dt=1, obj_buffer=0, label_kwargs=None, checkpoint_file=None):
+        self.method = method
+        self.min_intensity = min_intensity
+        self.max_intensity = max_intensity
+        self.x_grid = x_grid
+        self.y_grid = y_grid
+        self.distance_components = distance_components
+        self.distance_maxima = distance_maxima
+        self.distance_weights = distance_weights
+        self.dx = dx
+        self.dt = dt
+        self.obj_buffer = obj_buffer
+        self.label_kwargs = {} if label_kwargs is None else label_kwargs
+        self.checkpoint_file = checkpoint_file
+        self.tracked_objects = []
+        self.active_tracks = []
+        self.last_time = None
+        self.previous_data = None
+        # Position of each track in tracked_objects, keyed by id, and the times with a finished track file
+        self.track_indices = {}
+        self.finished_times = []
+        if self.checkpoint_file is not None and exists(self.checkpoint_file):
+            self.load_checkpoint()
+
+    def add_time(self, data, time):
+        """
+        Label the storms in one time slice and add them to the tracks. The state is checkpointed afterward if a
+        checkpoint file is set.
+
+        Args:
+            data: 2D array of the field being tracked at this time
+            time: Time of the slice, preferably as an integer. Times must be added in increasing order.
+
+        Returns:
+            List of the STObjects found in the slice, which are either new tracks or steps added to active tracks.
+        """
+        if self.last_time is not None and time <= self.last_time:
+            raise ValueError("Time {0} is not after the last time added, {1}".format(time, self.last_time))
+        label_grid = label_storm_objects(data, self.method, self.min_intensity, self.max_intensity,
+                                         **self.label_kwargs)
+        storm_objects = extract_storm_objects(label_grid[np.newaxis], data[np.newaxis], self.x_grid, self.y_grid,
+                                              [time], dx=self.dx, dt=self.dt, obj_buffer=self.obj_buffer)[0]
+        if self.previous_data is not None:
+            for storm_object in storm_objects:
+                dims = storm_object.timesteps[0].shape
+                storm_object.estimate_motion(time, self.previous_data, dims[1], dims[0])
+        previous_active = list(self.active_tracks)
+        tracks = track_storms([storm_objects], [time], self.distance_components, self.distance_maxima,
+                              self.distance_weights, tracked_objects=list(self.active_tracks))
+        for track in tracks[len(previous_active):]:
+            self.track_indices[id(track)] = len(self.tracked_objects)
+            self.tracked_objects.append(track)
+        self.active_tracks = [track for track in tracks if track.end_time == time]
+        self.last_time = time
+        self.previous_data = np.array(data)
+        if self.checkpoint_file is not None:
+            self.save_checkpoint([track for track in previous_active if track.end_time != time])
+        return storm_objects
+
+    def finished_tracks(self):
+        """
+        Get the tracks that cannot be extended by later time slices.
+
+        Returns:
+            List of STObjects
+        """
+        active_ids = set([id(track) for track in self.active_tracks])
+        return [track for track in self.tracked_objects if id(track) not in active_ids]
+
+    def finished_file(self, time):
+        """
+        Get the name of the file storing the tracks that finished at a time.
+
+        Args:
+            time: Time at which the tracks finished
+
+        Returns:
+            Name of the netCDF4 track file
+        """
+        base, extension = splitext(self.checkpoint_file)
+        return "{0}_finished_{1}{2}".format(base, time, extension)
+
+    def save_checkpoint(self, finished):
+        """
+        Write the tracks that finished at the last time to their own file, then write the active tracks, the last
+        time, and the last time slice to the checkpoint file. The checkpoint is written under a temporary name and then
+        renamed, so an interrupted write leaves the previous checkpoint intact. A finished track file that is not
+        listed in the checkpoint is overwritten when its time is added again.
+
+        Args:
+            finished: List of the tracks that were active before the last time and were not extended by it
+        """
+        if len(finished) > 0:
+            write_track_file(finished, self.finished_file(self.last_time),
+                             metadata=[{"index": self.track_indices[id(track)]} for track in finished])
+            self.finished_times.append(self.last_time)
+        temp_file = self.checkpoint_file + ".tmp"
+        file_metadata = {}
+        if len(self.finished_times) > 0:
+            file_metadata["finished_times"] = np.array(self.finished_times)
+        if self.last_time is not None:
+            file_metadata["last_time"] = self.last_time
+        write_track_file(self.active_tracks, temp_file,
+                         metadata=[{"index": self.track_indices[id(track)]} for track in self.active_tracks],
+                         file_metadata=file_metadata)
+        if self.previous_data is not None:
+            out_file = Dataset(temp_file, "a")
+            # The x and y names are already used by the pixel coordinate variables of the track file.
+            out_file.createDimension("grid_row", self.previous_data.shape[0])
+            out_file.createDimension("grid_column", self.previous_data.shape[1])
+            previous_data = out_file.createVariable("previous_data", self.previous_data.dtype,
+                                                    ("grid_row", "grid_column"), zlib=True)
+            previous_data[:] = self.previous_data
+            out_file.close()
+        replace(temp_file, self.checkpoint_file)
+        return
+
+    def load_checkpoint(self):
+        """
+        Load the active tracks, last time, and last time slice from the checkpoint file, and the finished tracks from
+        the finished track files listed in it.
+        """
+        indexed_tracks = []
+        with TrackFile(self.checkpoint_file) as track_file:
+            self.active_tracks = list(track_file)
+            indexed_tracks.extend([(track_file.metadata(t)["index"], track)
+                                   for t, track in enumerate(self.active_tracks)])
+            if "finished_times" in track_file.dataset.ncattrs():
+                self.finished_times = np.atleast_1d(track_file.dataset.getncattr("finished_times")).tolist()
+            if "last_time" in track_file.dataset.ncattrs():
+                self.last_time = track_file.dataset.getncattr("last_time").item()
+            if "previous_data" in track_file.dataset.variables.keys():
+                self.previous_data = track_file.dataset.variables["previous_data"][:]
+        for time in self.finished_times:
+            with TrackFile(self.finished_file(time)) as track_file:
+                indexed_tracks.extend([(track_file.metadata(t)["index"], track)
+                                       for t, track in enumerate(track_file)])
+        indexed_tracks.sort(key=lambda indexed_track: indexed_track[0])
+        self.tracked_objects = [track for index, track in indexed_tracks]
+        self.track_indices = dict([(id(track), index) for index, track in enumerate(self.tracked_objects)])
+        return
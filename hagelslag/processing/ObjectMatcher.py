@@ -1,5 +1,9 @@
 import numpy as np
 from hagelslag.util.munkres import Munkres
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
 import pandas as pd
 
 
@@ -14,12 +18,17 @@ class ObjectMatcher(object):
         cost_function_components: List of distance functions for matching
         weights: List of weights for each distance function
         max_values : List of the maximum allowable distance for each distance function component.
+        solver: Name of the assignment solver in ASSIGNMENT_SOLVERS used for matching.
+        gate_distance: If set, objects with centers of mass this far apart or farther are never matched, and only the
+            costs of pairs closer than gate_distance are calculated.
     """
 
-    def __init__(self, cost_function_components, weights, max_values):
+    def __init__(self, cost_function_components, weights, max_values, solver="scipy", gate_distance=None):
         self.cost_function_components = cost_function_components
         self.weights = weights
         self.max_values = max_values
+        self.solver = solver
+        self.gate_distance = gate_distance
         if self.weights.sum() != 1:
             self.weights /= float(self.weights.sum())
         return
@@ -37,24 +46,25 @@ class ObjectMatcher(object):
         Returns:
             List of tuples containing (set_a index, set_b index) for each match
         """
-        costs = self.cost_matrix(set_a, set_b, time_a, time_b) * 100
-        min_row_costs = costs.min(axis=1)
-        min_col_costs = costs.min(axis=0)
-        good_rows = np.where(min_row_costs < 100)[0]
-        good_cols = np.where(min_col_costs < 100)[0]
+        def block_cost_matrix(block_a, block_b):
+            return self.cost_matrix(block_a, block_b, time_a, time_b)
+
+        if self.gate_distance is None:
+            blocks = [(np.arange(len(set_a)), np.arange(len(set_b)), block_cost_matrix(set_a, set_b))]
+        else:
+            blocks = gated_cost_blocks(set_a, set_b, centers_of_mass(set_a, [time_a] * len(set_a)),
+                                       centers_of_mass(set_b, [time_b] * len(set_b)), self.gate_distance,
+                                       block_cost_matrix)
         assignments = []
-        if len(good_rows) > 0 and len(good_cols) > 0:
-            munk = Munkres()
-            initial_assignments = munk.compute(costs[tuple(np.meshgrid(good_rows, good_cols, indexing='ij'))].tolist())
-            initial_assignments = [(good_rows[x[0]], good_cols[x[1]]) for x in initial_assignments]
-            for a in initial_assignments:
-                if costs[a[0], a[1]] < 100:
-                    assignments.append(a)
-        return assignments
+        for rows, cols, costs in blocks:
+            assignments.extend([(rows[a], cols[b]) for a, b in block_assignment(costs * 100, self.solver)])
+        return sorted(assignments)
 
     def cost_matrix(self, set_a, set_b, time_a, time_b):
         """
-        Calculates the costs (distances) between the items in set a and set b at the specified times.
+        Calculates the costs (distances) between the items in set a and set b at the specified times. Cost function
+        components in COST_MATRIX_FUNCTIONS are calculated for all pairs at once, and total_cost_function gives the
+        same value for each pair.
 
         Args:
             set_a: List of STObjects
@@ -66,11 +76,9 @@ class ObjectMatcher(object):
             A numpy array with shape [len(set_a), len(set_b)] containing the cost matrix between the items in set a
             and the items in set b.
         """
-        costs = np.zeros((len(set_a), len(set_b)))
-        for a, item_a in enumerate(set_a):
-            for b, item_b in enumerate(set_b):
-                costs[a, b] = self.total_cost_function(item_a, item_b, time_a, time_b)
-        return costs
+        distances = component_cost_matrices(self.cost_function_components, self.max_values,
+                                            set_a, [time_a] * len(set_a), set_b, [time_b] * len(set_b))
+        return np.sum(self.weights[:, np.newaxis, np.newaxis] * distances, axis=0)
 
     def total_cost_function(self, item_a, item_b, time_a, time_b):
         """
@@ -101,13 +109,21 @@ class TrackMatcher(object):
         weights: Array of weights for each cost function. All should sum to 1.
         max_values: Array of distance values that correspond to the upper limit distance that should be
             considered.
+        solver: Name of the assignment solver in ASSIGNMENT_SOLVERS used for 1:1 matching.
+        gate_distance: Maximum start_centroid_distance if it is one of the cost function components. Tracks starting
+            this far apart always have a cost of 1, so only the costs of tracks starting closer together are
+            calculated when matching.
 
     """
 
-    def __init__(self, cost_function_components, weights, max_values):
+    def __init__(self, cost_function_components, weights, max_values, solver="scipy"):
         self.cost_function_components = cost_function_components
         self.weights = weights if weights.sum() == 1 else weights / weights.sum()
         self.max_values = max_values
+        self.solver = solver
+        self.gate_distance = None
+        if start_centroid_distance in self.cost_function_components:
+            self.gate_distance = self.max_values[self.cost_function_components.index(start_centroid_distance)]
 
     def match_tracks(self, set_a, set_b, closest_matches=False):
         """
@@ -123,33 +139,27 @@ class TrackMatcher(object):
         Returns:
 
         """
-        costs = self.track_cost_matrix(set_a, set_b) * 100
-        min_row_costs = costs.min(axis=1)
-        min_col_costs = costs.min(axis=0)
-        good_rows = np.where(min_row_costs < 100)[0]
-        good_cols = np.where(min_col_costs < 100)[0]
+        if self.gate_distance is None:
+            blocks = [(np.arange(len(set_a)), np.arange(len(set_b)), self.track_cost_matrix(set_a, set_b))]
+        else:
+            # The gate is widened slightly so rounding in the KD-tree never drops a pair with a cost below 1.
+            blocks = gated_cost_blocks(set_a, set_b, centers_of_mass(set_a, [item.times[0] for item in set_a]),
+                                       centers_of_mass(set_b, [item.times[0] for item in set_b]),
+                                       self.gate_distance * (1 + 1e-9), self.track_cost_matrix, mask=False)
         assignments = []
-        if len(good_rows) > 0 and len(good_cols) > 0:
+        for rows, cols, costs in blocks:
+            costs = costs * 100
             if closest_matches:
-                b_matches = costs[np.meshgrid(good_rows, good_cols, indexing='ij')].argmin(axis=1)
-                a_matches = np.arange(b_matches.size)
-                initial_assignments = [(good_rows[a_matches[x]], good_cols[b_matches[x]])
-                                       for x in range(b_matches.size)]
+                b_matches = costs.argmin(axis=1)
+                assignments.extend([(rows[a], cols[b_matches[a]]) for a in range(rows.size)
+                                    if costs[a, b_matches[a]] < 100])
             else:
-                munk = Munkres()
-                initial_assignments = munk.compute(costs[np.meshgrid(good_rows, good_cols, indexing='ij')].tolist())
-                initial_assignments = [(good_rows[x[0]], good_cols[x[1]]) for x in initial_assignments]
-            for a in initial_assignments:
-                if costs[a[0], a[1]] < 100:
-                    assignments.append(a)
-        return assignments
+                assignments.extend([(rows[a], cols[b]) for a, b in block_assignment(costs, self.solver)])
+        return sorted(assignments)
 
     def raw_cost_matrix(self, set_a, set_b):
-        cost_matrix = np.zeros((len(set_a), len(set_b), len(self.cost_function_components)))
-        for (a, b, c), x in np.ndenumerate(cost_matrix):
-            cost_matrix[a, b, c] = self.cost_function_components[c](set_a[a],
-                                                                    set_b[b], self.max_values[c]) * self.max_values[c]
-        return cost_matrix
+        distances = track_cost_matrices(self.cost_function_components, self.max_values, set_a, set_b)
+        return distances.transpose(1, 2, 0) * np.asarray(self.max_values)
 
     def neighbor_matches(self, set_a, set_b):
         costs = self.track_cost_matrix(set_a, set_b)
@@ -162,11 +172,21 @@ class TrackMatcher(object):
         return all_neighbors
 
     def track_cost_matrix(self, set_a, set_b):
-        costs = np.zeros((len(set_a), len(set_b)))
-        for a, item_a in enumerate(set_a):
-            for b, item_b in enumerate(set_b):
-                costs[a, b] = self.track_cost_function(item_a, item_b)
-        return costs
+        """
+        Calculates the costs between the tracks in set a and set b. Cost function components in
+        TRACK_COST_MATRIX_FUNCTIONS are calculated for all pairs at once, and track_cost_function gives the same value
+        for each pair.
+
+        Args:
+            set_a: List of STObjects
+            set_b: List of STObjects
+
+        Returns:
+            A numpy array with shape [len(set_a), len(set_b)] containing the costs.
+        """
+        distances = track_cost_matrices(self.cost_function_components, self.max_values, set_a, set_b)
+        return np.where(np.all(distances < 1, axis=0),
+                        np.sum(self.weights[:, np.newaxis, np.newaxis] * distances, axis=0), 1.0)
 
     def track_cost_function(self, item_a, item_b):
         distances = np.zeros(len(self.weights))
@@ -224,19 +244,12 @@ class TrackStepMatcher(object):
         return track_pairings
 
     def cost_matrix(self, set_a, set_b):
-        num_steps_a = np.sum([track_a.times.size for track_a in set_a])
-        num_steps_b = np.sum([track_b.times.size for track_b in set_b])
-        cost_matrix = np.zeros((num_steps_a, num_steps_b, len(self.cost_function_components)))
-        a_i = 0
-        for a, track_a in enumerate(set_a):
-            for time_a in track_a.times:
-                b_i = 0
-                for b, track_b in enumerate(set_b):
-                    for time_b in track_b.times:
-                        cost_matrix[a_i, b_i] = self.cost(track_a, time_a, track_b, time_b)
-                        b_i += 1
-                a_i += 1
-        return cost_matrix
+        steps_a = [(track_a, time_a) for track_a in set_a for time_a in track_a.times]
+        steps_b = [(track_b, time_b) for track_b in set_b for time_b in track_b.times]
+        distances = component_cost_matrices(self.cost_function_components, self.max_values,
+                                            [step[0] for step in steps_a], [step[1] for step in steps_a],
+                                            [step[0] for step in steps_b], [step[1] for step in steps_b])
+        return distances.transpose(1, 2, 0)
 
     def cost(self, track_a, time_a, track_b, time_b):
         return np.array([cost_func(track_a, time_a, track_b, time_b, self.max_values[c])
@@ -283,11 +296,11 @@ def shifted_centroid_distance(item_a, time_a, item_b, time_b, max_value):
     ax, ay = item_a.center_of_mass(time_a)
     bx, by = item_b.center_of_mass(time_b)
     if time_a < time_b:
-        bx = bx - item_b.u
-        by = by - item_b.v
+        bx = bx - item_b.u[item_b.times == time_b][0]
+        by = by - item_b.v[item_b.times == time_b][0]
     else:
-        ax = ax - item_a.u
-        ay = ay - item_a.v
+        ax = ax - item_a.u[item_a.times == time_a][0]
+        ay = ay - item_a.v[item_a.times == time_a][0]
     return np.minimum(np.sqrt((ax - bx) ** 2 + (ay - by) ** 2), max_value) / float(max_value)
 
 
@@ -492,3 +505,358 @@ def mean_area_distance(item_a, item_b, max_value):
     mean_area_a = np.mean([item_a.size(t) for t in item_a.times])
     mean_area_b = np.mean([item_b.size(t) for t in item_b.times])
     return np.abs(mean_area_a - mean_area_b) / float(max_value)
+
+
+def munkres_assignment(costs):
+    """
+    Find the lowest cost assignment with the pure-Python Munkres implementation.
+
+    Args:
+        costs: 2D array of costs. The matrix may be rectangular.
+
+    Returns:
+        List of (row, column) tuples sorted by row
+    """
+    return [(int(row), int(col)) for row, col in Munkres().compute(np.asarray(costs).tolist())]
+
+
+def scipy_assignment(costs):
+    """
+    Find the lowest cost assignment with scipy.optimize.linear_sum_assignment, which runs in compiled code and
+    solves rectangular matrices directly.
+
+    Args:
+        costs: 2D array of costs. The matrix may be rectangular.
+
+    Returns:
+        List of (row, column) tuples sorted by row
+    """
+    rows, cols = linear_sum_assignment(costs)
+    return list(zip(rows.tolist(), cols.tolist()))
+
+
+ASSIGNMENT_SOLVERS = {"munkres": munkres_assignment, "scipy": scipy_assignment}
+
+
+def optimal_assignment(costs, solver="scipy"):
+    """
+    Find the assignment of rows to columns of a cost matrix that has the lowest total cost. Each row and each column
+    is assigned at most once, so min(rows, columns) pairs are returned.
+
+    Args:
+        costs: 2D array of costs
+        solver: Name of the solver in ASSIGNMENT_SOLVERS or a function taking the cost matrix and returning a list of
+            (row, column) tuples.
+
+    Returns:
+        List of (row, column) tuples sorted by row
+    """
+    if callable(solver):
+        return solver(costs)
+    if solver not in ASSIGNMENT_SOLVERS.keys():
+        raise ValueError("Unknown assignment solver " + str(solver))
+    return ASSIGNMENT_SOLVERS[solver](costs)
+
+
+def connected_blocks(rows, cols, num_a, num_b):
+    """
+    Group the pairs of items from two sets into blocks that share no items with each other. Two pairs are in the
+    same block if they are linked by a chain of pairs that share an item.
+
+    Args:
+        rows: Array of the set a index of each pair
+        cols: Array of the set b index of each pair
+        num_a: Number of items in set a
+        num_b: Number of items in set b
+
+    Returns:
+        List of (set a indices, set b indices, pair indices) arrays of each block. Items not in any pair are left out.
+    """
+    graph = coo_matrix((np.ones(rows.size), (rows, cols + num_a)), shape=(num_a + num_b, num_a + num_b))
+    labels = connected_components(graph, directed=False)[1]
+    pair_labels = labels[rows]
+    block_labels = np.unique(pair_labels)
+    splits = []
+    for item_labels in [labels[:num_a], labels[num_a:], pair_labels]:
+        order = np.argsort(item_labels, kind="stable")
+        bounds = np.searchsorted(item_labels[order], [block_labels, block_labels + 1])
+        splits.append([order[start:end] for start, end in zip(*bounds)])
+    return list(zip(*splits))
+
+
+def gate_pairs(centers_a, centers_b, max_distance):
+    """
+    Find the pairs of points from two sets that are closer than max_distance with a KD-tree, so the distances between
+    points farther apart are never calculated.
+
+    Args:
+        centers_a: Tuple of the x- and y-coordinate arrays of set a
+        centers_b: Tuple of the x- and y-coordinate arrays of set b
+        max_distance: Distance limit
+
+    Returns:
+        Arrays of the set a and set b indices of each pair
+    """
+    points_a = np.stack(centers_a, axis=-1)
+    points_b = np.stack(centers_b, axis=-1)
+    if points_a.shape[0] == 0 or points_b.shape[0] == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    neighbors = cKDTree(points_a).query_ball_tree(cKDTree(points_b), max_distance)
+    rows = np.repeat(np.arange(len(neighbors)), [len(n) for n in neighbors])
+    cols = np.array([b for n in neighbors for b in n], dtype=int)
+    distances = np.sqrt(np.sum((points_a[rows] - points_b[cols]) ** 2, axis=1))
+    close = distances < max_distance
+    return rows[close], cols[close]
+
+
+def gated_cost_blocks(set_a, set_b, centers_a, centers_b, gate_distance, cost_matrix, mask=True):
+    """
+    Split the matching of two sets into independent blocks of items that are within gate_distance of each other and
+    calculate the cost matrix of each block.
+
+    Args:
+        set_a: List of STObjects
+        set_b: List of STObjects
+        centers_a: Tuple of the x- and y-coordinate arrays used for gating set a
+        centers_b: Tuple of the x- and y-coordinate arrays used for gating set b
+        gate_distance: Pairs this far apart or farther are not matched.
+        cost_matrix: Function calculating the cost matrix between two lists of STObjects
+        mask: If True, the costs of pairs in a block that are not within gate_distance are set to 1. Not needed if
+            the cost function already gives those pairs a cost of 1.
+
+    Returns:
+        List of (set a indices, set b indices, cost matrix) of each block
+    """
+    rows, cols = gate_pairs(centers_a, centers_b, gate_distance)
+    blocks = []
+    for block_rows, block_cols, block_pairs in connected_blocks(rows, cols, len(set_a), len(set_b)):
+        costs = cost_matrix([set_a[a] for a in block_rows], [set_b[b] for b in block_cols])
+        if mask:
+            gate = np.zeros(costs.shape, dtype=bool)
+            gate[np.searchsorted(block_rows, rows[block_pairs]), np.searchsorted(block_cols, cols[block_pairs])] = True
+            costs = np.where(gate, costs, 1.0)
+        blocks.append((block_rows, block_cols, costs))
+    return blocks
+
+
+def block_assignment(costs, solver="scipy", max_cost=100):
+    """
+    Find the lowest cost assignment of a cost matrix using only pairs below max_cost. The pairs below max_cost are
+    split into connected blocks and each block is solved separately, which gives the same matches as solving the
+    whole matrix with every pair at or above max_cost left unmatched.
+
+    Args:
+        costs: 2D array of costs
+        solver: Name of the solver in ASSIGNMENT_SOLVERS or a solver function
+        max_cost: Pairs with costs at or above this value are not matched.
+
+    Returns:
+        List of (row, column) tuples sorted by row
+    """
+    rows, cols = np.nonzero(costs < max_cost)
+    assignments = []
+    for block_rows, block_cols, block_pairs in connected_blocks(rows, cols, costs.shape[0], costs.shape[1]):
+        if block_pairs.size == 1:
+            assignments.append((rows[block_pairs[0]], cols[block_pairs[0]]))
+            continue
+        for a, b in optimal_assignment(costs[np.ix_(block_rows, block_cols)], solver):
+            if costs[block_rows[a], block_cols[b]] < max_cost:
+                assignments.append((block_rows[a], block_cols[b]))
+    return sorted(assignments)
+
+
+def component_cost_matrices(cost_function_components, max_values, set_a, times_a, set_b, times_b):
+    """
+    Calculate the distances between every pair of items from two sets for each cost function component. Components
+    in COST_MATRIX_FUNCTIONS are calculated for all pairs at once. Other components are called for each pair.
+
+    Args:
+        cost_function_components: List of cost functions
+        max_values: Maximum distance value of each cost function
+        set_a: List of STObjects
+        times_a: Time at which each item in set_a is evaluated
+        set_b: List of STObjects
+        times_b: Time at which each item in set_b is evaluated
+
+    Returns:
+        Array of distances with shape [len(cost_function_components), len(set_a), len(set_b)]
+    """
+    distances = np.zeros((len(cost_function_components), len(set_a), len(set_b)))
+    for c, component in enumerate(cost_function_components):
+        if component in COST_MATRIX_FUNCTIONS.keys():
+            distances[c] = COST_MATRIX_FUNCTIONS[component](set_a, np.asarray(times_a), set_b, np.asarray(times_b),
+                                                            max_values[c])
+        else:
+            for a, item_a in enumerate(set_a):
+                for b, item_b in enumerate(set_b):
+                    distances[c, a, b] = component(item_a, times_a[a], item_b, times_b[b], max_values[c])
+    return distances
+
+
+def track_cost_matrices(cost_function_components, max_values, set_a, set_b):
+    """
+    Calculate the distances between every pair of tracks from two sets for each track cost function component.
+    Components in TRACK_COST_MATRIX_FUNCTIONS are calculated for all pairs at once. Other components are called for
+    each pair.
+
+    Args:
+        cost_function_components: List of track cost functions
+        max_values: Maximum distance value of each cost function
+        set_a: List of STObjects
+        set_b: List of STObjects
+
+    Returns:
+        Array of distances with shape [len(cost_function_components), len(set_a), len(set_b)]
+    """
+    distances = np.zeros((len(cost_function_components), len(set_a), len(set_b)))
+    for c, component in enumerate(cost_function_components):
+        if component in TRACK_COST_MATRIX_FUNCTIONS.keys():
+            distances[c] = TRACK_COST_MATRIX_FUNCTIONS[component](set_a, set_b, max_values[c])
+        else:
+            for a, item_a in enumerate(set_a):
+                for b, item_b in enumerate(set_b):
+                    distances[c, a, b] = component(item_a, item_b, max_values[c])
+    return distances
+
+
+def centers_of_mass(items, times):
+    """
+    Get the center of mass of each item at the time it is evaluated.
+
+    Args:
+        items: List of STObjects
+        times: Time of each item
+
+    Returns:
+        Arrays of the x- and y-coordinates of each center of mass
+    """
+    centers = np.array([item.center_of_mass(time) for item, time in zip(items, times)], dtype=float).reshape(-1, 2)
+    return centers[:, 0], centers[:, 1]
+
+
+def centroid_distance_matrix(set_a, times_a, set_b, times_b, max_value):
+    """
+    centroid_distance between every pair of items in set_a and set_b.
+
+    Args:
+        set_a: List of STObjects
+        times_a: Array of the time at which each item in set_a is evaluated
+        set_b: List of STObjects
+        times_b: Array of the time at which each item in set_b is evaluated
+        max_value: Maximum distance value used as scaling value and upper constraint.
+
+    Returns:
+        Array of distances between 0 and 1 with shape [len(set_a), len(set_b)]
+    """
+    ax, ay = centers_of_mass(set_a, times_a)
+    bx, by = centers_of_mass(set_b, times_b)
+    return np.minimum(np.sqrt((ax[:, np.newaxis] - bx) ** 2 + (ay[:, np.newaxis] - by) ** 2),
+                      max_value) / float(max_value)
+
+
+def time_distance_matrix(set_a, times_a, set_b, times_b, max_value):
+    """
+    time_distance between every pair of items in set_a and set_b. See centroid_distance_matrix for arguments.
+    """
+    return np.minimum(np.abs(times_b - times_a[:, np.newaxis]), max_value) / float(max_value)
+
+
+def shifted_centroid_distance_matrix(set_a, times_a, set_b, times_b, max_value):
+    """
+    shifted_centroid_distance between every pair of items in set_a and set_b. The motion of each item at the time
+    it is evaluated is used, which is the same as shifted_centroid_distance for single-step objects. See
+    centroid_distance_matrix for arguments.
+    """
+    ax, ay = centers_of_mass(set_a, times_a)
+    bx, by = centers_of_mass(set_b, times_b)
+    motion_a = np.array([(item.u[item.times == time][0], item.v[item.times == time][0])
+                         for item, time in zip(set_a, times_a)], dtype=float).reshape(-1, 2)
+    motion_b = np.array([(item.u[item.times == time][0], item.v[item.times == time][0])
+                         for item, time in zip(set_b, times_b)], dtype=float).reshape(-1, 2)
+    b_later = times_a[:, np.newaxis] < times_b
+    ax = np.where(b_later, ax[:, np.newaxis], (ax - motion_a[:, 0])[:, np.newaxis])
+    ay = np.where(b_later, ay[:, np.newaxis], (ay - motion_a[:, 1])[:, np.newaxis])
+    bx = np.where(b_later, bx - motion_b[:, 0], bx)
+    by = np.where(b_later, by - motion_b[:, 1], by)
+    return np.minimum(np.sqrt((ax - bx) ** 2 + (ay - by) ** 2), max_value) / float(max_value)
+
+
+def max_intensity_matrix(set_a, times_a, set_b, times_b, max_value):
+    """
+    max_intensity difference between every pair of items in set_a and set_b. See centroid_distance_matrix for
+    arguments.
+    """
+    intensity_a = np.array([item.max_intensity(time) for item, time in zip(set_a, times_a)])
+    intensity_b = np.array([item.max_intensity(time) for item, time in zip(set_b, times_b)])
+    diff = np.sqrt((intensity_a[:, np.newaxis] - intensity_b) ** 2)
+    return np.minimum(diff, max_value) / float(max_value)
+
+
+def area_difference_matrix(set_a, times_a, set_b, times_b, max_value):
+    """
+    area_difference between every pair of items in set_a and set_b. See centroid_distance_matrix for arguments.
+    """
+    size_a = np.array([item.size(time) for item, time in zip(set_a, times_a)])
+    size_b = np.array([item.size(time) for item, time in zip(set_b, times_b)])
+    diff = np.sqrt((size_a[:, np.newaxis] - size_b) ** 2)
+    return np.minimum(diff, max_value) / float(max_value)
+
+
+def start_centroid_distance_matrix(set_a, set_b, max_value):
+    """
+    start_centroid_distance between every pair of tracks in set_a and set_b.
+
+    Args:
+        set_a: List of STObjects
+        set_b: List of STObjects
+        max_value: Maximum distance value used as scaling value and upper constraint.
+
+    Returns:
+        Array of distances between 0 and 1 with shape [len(set_a), len(set_b)]
+    """
+    start_ax, start_ay = centers_of_mass(set_a, [item.times[0] for item in set_a])
+    start_bx, start_by = centers_of_mass(set_b, [item.times[0] for item in set_b])
+    start_distance = np.sqrt((start_ax[:, np.newaxis] - start_bx) ** 2 + (start_ay[:, np.newaxis] - start_by) ** 2)
+    return np.minimum(start_distance, max_value) / float(max_value)
+
+
+def start_time_distance_matrix(set_a, set_b, max_value):
+    """
+    start_time_distance between every pair of tracks in set_a and set_b. See start_centroid_distance_matrix for
+    arguments.
+    """
+    start_a = np.array([item.times[0] for item in set_a])
+    start_b = np.array([item.times[0] for item in set_b])
+    return np.minimum(np.abs(start_a[:, np.newaxis] - start_b), max_value) / float(max_value)
+
+
+def duration_distance_matrix(set_a, set_b, max_value):
+    """
+    duration_distance between every pair of tracks in set_a and set_b. See start_centroid_distance_matrix for
+    arguments.
+    """
+    duration_a = np.array([item.times.size for item in set_a])
+    duration_b = np.array([item.times.size for item in set_b])
+    return np.minimum(np.abs(duration_a[:, np.newaxis] - duration_b), max_value) / float(max_value)
+
+
+def mean_area_distance_matrix(set_a, set_b, max_value):
+    """
+    mean_area_distance between every pair of tracks in set_a and set_b. See start_centroid_distance_matrix for
+    arguments.
+    """
+    mean_area_a = np.array([np.mean([item.size(t) for t in item.times]) for item in set_a])
+    mean_area_b = np.array([np.mean([item.size(t) for t in item.times]) for item in set_b])
+    return np.abs(mean_area_a[:, np.newaxis] - mean_area_b) / float(max_value)
+
+
+# Functions that calculate a cost function component for all pairs of objects or tracks at once.
+COST_MATRIX_FUNCTIONS = {centroid_distance: centroid_distance_matrix,
+                         time_distance: time_distance_matrix,
+                         shifted_centroid_distance: shifted_centroid_distance_matrix,
+                         max_intensity: max_intensity_matrix,
+                         area_difference: area_difference_matrix}
+TRACK_COST_MATRIX_FUNCTIONS = {start_centroid_distance: start_centroid_distance_matrix,
+                               start_time_distance: start_time_distance_matrix,
+                               duration_distance: duration_distance_matrix,
+                               mean_area_distance: mean_area_distance_matrix}
@@ -1,7 +1,7 @@
 import numpy as np
 from skimage.measure import regionprops
-from skimage.segmentation import find_boundaries
 from skimage.morphology import convex_hull_image
+from scipy.spatial import cKDTree
 import json
 
 
@@ -22,9 +22,14 @@ class STObject(object):
         dx: grid spacing
         u: storm motion in x-direction
         v: storm motion in y-direction
+        corners: (i, j) index of the upper left corner of each timestep if the object uses compact storage and None
+            otherwise. See compress.
+        cache: Geometric properties already calculated for each timestep. The cache is cleared by extend. Call
+            clear_cache after modifying the timesteps or masks of an object in place.
     """
 
     def __init__(self, grid, mask, x, y, i, j, start_time, end_time, step=1, dx=4000, u=None, v=None):
+        self.corners = None
         if hasattr(grid, "shape") and len(grid.shape) == 2:
             self.timesteps = [grid]
             self.masks = [np.array(mask, dtype=int)]
@@ -66,6 +71,140 @@ class STObject(object):
         self.times = np.arange(start_time, end_time + step, step)
         self.attributes = {}
         self.observations = None
+        self.packed_masks = None
+        self.x_grid = None
+        self.y_grid = None
+        self.cache = {}
+
+    def clear_cache(self):
+        """
+        Remove all cached geometric properties.
+        """
+        self.cache = {}
+        return
+
+    def __getstate__(self):
+        # The cache holds KD-trees and pixel arrays that are rebuilt on demand, so it is not pickled.
+        state = self.__dict__.copy()
+        state["cache"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "cache" not in state:
+            self.cache = {}
+
+    @property
+    def masks(self):
+        if self.corners is None:
+            return self._masks
+        return CompactSteps(self, "masks")
+
+    @masks.setter
+    def masks(self, masks):
+        self._masks = masks
+
+    @property
+    def x(self):
+        if self.corners is None:
+            return self._x
+        return CompactSteps(self, "x")
+
+    @x.setter
+    def x(self, x):
+        self._x = x
+
+    @property
+    def y(self):
+        if self.corners is None:
+            return self._y
+        return CompactSteps(self, "y")
+
+    @y.setter
+    def y(self, y):
+        self._y = y
+
+    @property
+    def i(self):
+        if self.corners is None:
+            return self._i
+        return CompactSteps(self, "i")
+
+    @i.setter
+    def i(self, i):
+        self._i = i
+
+    @property
+    def j(self):
+        if self.corners is None:
+            return self._j
+        return CompactSteps(self, "j")
+
+    @j.setter
+    def j(self, j):
+        self._j = j
+
+    def compress(self, x_grid, y_grid):
+        """
+        Switch the object to compact storage. Each mask is bit-packed, and x, y, i, and j are replaced by the corner
+        of each timestep within the full model grid. The masks, x, y, i, and j attributes still return one array per
+        timestep, but the arrays are created when accessed and are read-only copies or views. x_grid and y_grid are
+        shared by reference, so pickling a list of compact objects stores them once. Cached properties are cleared
+        so pixel arrays calculated from the full arrays are not kept.
+
+        Args:
+            x_grid: 2D array of x-coordinates for the full model domain.
+            y_grid: 2D array of y-coordinates for the full model domain.
+        """
+        if self.corners is None:
+            self.corners, self.packed_masks = self.compact_steps()
+            self._masks = self._x = self._y = self._i = self._j = None
+        self.x_grid = x_grid
+        self.y_grid = y_grid
+        self.clear_cache()
+        return
+
+    def compact_steps(self):
+        """
+        Find the corner and bit-packed mask of each timestep.
+
+        Returns:
+            List of (i, j) corners and list of bit-packed masks.
+        """
+        if self.corners is not None:
+            return list(self.corners), list(self.packed_masks)
+        corners = []
+        packed_masks = []
+        for t in range(len(self.timesteps)):
+            shape = self.masks[t].shape
+            i = np.asarray(self.i[t])
+            j = np.asarray(self.j[t])
+            if i.size == 0:
+                corners.append((0, 0))
+            elif i[-1, -1] - i[0, 0] + 1 != shape[0] or j[-1, -1] - j[0, 0] + 1 != shape[1]:
+                raise ValueError("Timestep {0:d} is not a rectangular region of the model grid".format(t))
+            else:
+                corners.append((int(i[0, 0]), int(j[0, 0])))
+            packed_masks.append(np.packbits(self.masks[t].ravel() != 0))
+        return corners, packed_masks
+
+    def compact_step(self, attr, t):
+        """
+        Create the masks, x, y, i, or j array of a compact object at timestep index t.
+        """
+        shape = self.timesteps[t].shape
+        i0, j0 = self.corners[t]
+        if attr == "masks":
+            return np.unpackbits(self.packed_masks[t], count=shape[0] * shape[1]).reshape(shape).astype(int)
+        elif attr == "i":
+            return np.indices(shape)[0] + i0
+        elif attr == "j":
+            return np.indices(shape)[1] + j0
+        grid = self.x_grid if attr == "x" else self.y_grid
+        view = grid[i0:i0 + shape[0], j0:j0 + shape[1]]
+        # The view shares memory with the grid used by every compact object, so it must not be written to.
+        view.setflags(write=False)
+        return view
 
     @property
     def __str__(self):
@@ -86,6 +225,8 @@ class STObject(object):
         """
         if self.start_time <= time <= self.end_time:
             diff = time - self.start_time
+            if ("center_of_mass", diff) in self.cache.keys():
+                return self.cache[("center_of_mass", diff)]
             valid = np.flatnonzero(self.masks[diff] != 0)
             if valid.size > 0:
                 com_x = 1.0 / self.timesteps[diff].ravel()[valid].sum() * np.sum(self.timesteps[diff].ravel()[valid] *
@@ -95,6 +236,7 @@ class STObject(object):
             else:
                 com_x = np.mean(self.x[diff])
                 com_y = np.mean(self.y[diff])
+            self.cache[("center_of_mass", diff)] = (com_x, com_y)
         else:
             com_x = None
             com_y = None
@@ -102,7 +244,9 @@ class STObject(object):
 
     def closest_distance(self, time, other_object, other_time):
         """
-        The shortest distance between two objects at specified times.
+        The shortest distance between two objects at specified times. The nearest pixels are found with a KD-tree of
+        the other object's pixels, and the pairs within rounding error of the shortest distance are checked again with
+        the same arithmetic as a full pairwise distance matrix. Small objects are compared with the full matrix.
 
         Args:
             time (int or datetime): Valid time for this STObject
@@ -114,30 +258,123 @@ class STObject(object):
         """
         ti = np.where(self.times == time)[0][0]
         oti = np.where(other_object.times == other_time)[0][0]
-        xs = self.x[ti].ravel()[self.masks[ti].ravel() == 1]
-        xs = xs.reshape(xs.size, 1)
-        ys = self.y[ti].ravel()[self.masks[ti].ravel() == 1]
-        ys = ys.reshape(ys.size, 1)
-        o_xs = other_object.x[oti].ravel()[other_object.masks[oti].ravel() == 1]
-        o_xs = o_xs.reshape(1, o_xs.size)
-        o_ys = other_object.y[oti].ravel()[other_object.masks[oti].ravel() == 1]
-        o_ys = o_ys.reshape(1, o_ys.size)
-        distances = (xs - o_xs) ** 2 + (ys - o_ys) ** 2
-        return np.sqrt(distances.min())
+        points = self.pixel_points(ti)
+        o_points = other_object.pixel_points(oti)
+        if points.shape[0] == 0 or o_points.shape[0] == 0:
+            raise ValueError("Cannot find the closest distance to an object with no pixels")
+        if points.shape[0] * o_points.shape[0] <= 10000:
+            return np.sqrt(self.pair_distances_between(points, o_points, -np.inf, np.inf)[1].min())
+        tree_distances = other_object.pixel_tree(oti).query(points)[0]
+        search_radius = tree_distances.min() * (1 + 1e-9) + 1e-9
+        near = np.flatnonzero(tree_distances <= search_radius)
+        min_distance = np.inf
+        for p, neighbors in zip(near, other_object.pixel_tree(oti).query_ball_point(points[near], search_radius)):
+            distances = (points[p, 0] - o_points[neighbors, 0]) ** 2 + (points[p, 1] - o_points[neighbors, 1]) ** 2
+            min_distance = min(min_distance, distances.min())
+        return np.sqrt(min_distance)
 
     def percentile_distance(self, time, other_object, other_time, percentile):
+        """
+        Percentile of the distances between every pair of pixels in two objects. Pixel pair counts from KD-trees
+        narrow the range of distances containing the percentile, and then the distances are calculated in chunks,
+        keeping only the ones within that range, so the full pairwise distance matrix is never stored. The result
+        is identical to np.percentile of the full matrix.
+
+        Args:
+            time (int or datetime): Valid time for this STObject
+            other_object: Another STObject being compared
+            other_time: The time within the other STObject being evaluated.
+            percentile: percentile between 0 and 100
+
+        Returns:
+            Distance in units of the x-y coordinates
+        """
         ti = np.where(self.times == time)[0][0]
         oti = np.where(other_object.times == other_time)[0][0]
-        xs = self.x[ti][self.masks[ti] == 1]
-        xs = xs.reshape(xs.size, 1)
-        ys = self.y[ti][self.masks[ti] == 1]
-        ys = ys.reshape(ys.size, 1)
-        o_xs = other_object.x[oti][other_object.masks[oti] == 1]
-        o_xs = o_xs.reshape(1, o_xs.size)
-        o_ys = other_object.y[oti][other_object.masks[oti] == 1]
-        o_ys = o_ys.reshape(1, o_ys.size)
-        distances = (xs - o_xs) ** 2 + (ys - o_ys) ** 2
-        return np.sqrt(np.percentile(distances, percentile))
+        points = self.pixel_points(ti)
+        o_points = other_object.pixel_points(oti)
+        num_pairs = points.shape[0] * o_points.shape[0]
+        if num_pairs == 0:
+            raise ValueError("Cannot find the percentile distance to an object with no pixels")
+        if num_pairs <= 1000000:
+            return np.sqrt(np.percentile(self.pair_distances_between(points, o_points, -np.inf, np.inf)[1], percentile))
+        virtual_index = np.true_divide(percentile, 100) * (num_pairs - 1)
+        rank_lower = int(np.floor(virtual_index))
+        rank_upper = min(rank_lower + 1, num_pairs - 1)
+        # Find radii with at most rank_lower pairs closer than the lower radius and more than rank_upper pairs
+        # within the upper radius.
+        tree = self.pixel_tree(ti)
+        o_tree = other_object.pixel_tree(oti)
+        r_lower = 0.0
+        r_upper = np.sqrt(np.sum((points.max(axis=0) - o_points.min(axis=0)) ** 2 +
+                                 (o_points.max(axis=0) - points.min(axis=0)) ** 2)) + 1.0
+        for r in range(4):
+            radii = np.linspace(r_lower, r_upper, 65)
+            counts = tree.count_neighbors(o_tree, radii)
+            r_lower = radii[max(np.searchsorted(counts, rank_lower, side="right") - 1, 0)]
+            r_upper = radii[min(np.searchsorted(counts, rank_upper + 1), radii.size - 1)]
+        lower_sq = (r_lower * (1 - 1e-9)) ** 2
+        upper_sq = (r_upper * (1 + 1e-9)) ** 2
+        num_below, in_range = self.pair_distances_between(points, o_points, lower_sq, upper_sq)
+        if num_below > rank_lower or num_below + in_range.size <= rank_upper:
+            num_below, in_range = self.pair_distances_between(points, o_points, -np.inf, np.inf)
+        in_range = np.sort(in_range)
+        lower = in_range[rank_lower - num_below]
+        upper = in_range[rank_upper - num_below]
+        # Linear interpolation in the same way as np.percentile
+        gamma = virtual_index - rank_lower
+        diff = upper - lower
+        if gamma >= 0.5:
+            distance = upper - diff * (1 - gamma)
+        else:
+            distance = lower + diff * gamma
+        return np.sqrt(distance)
+
+    @staticmethod
+    def pair_distances_between(points, o_points, lower_sq, upper_sq):
+        """
+        Calculate the squared distances between every pair of points in chunks.
+
+        Args:
+            points: (n, 2) array of x and y coordinates
+            o_points: (m, 2) array of x and y coordinates
+            lower_sq: lower limit of the squared distances that are kept
+            upper_sq: upper limit of the squared distances that are kept
+
+        Returns:
+            The number of squared distances below lower_sq and an array of the squared distances between lower_sq
+            and upper_sq.
+        """
+        chunk_size = max(1, 1000000 // o_points.shape[0])
+        num_below = 0
+        in_range = []
+        for c in range(0, points.shape[0], chunk_size):
+            distances = (points[c:c + chunk_size, 0:1] - o_points[:, 0]) ** 2 + \
+                (points[c:c + chunk_size, 1:2] - o_points[:, 1]) ** 2
+            num_below += np.count_nonzero(distances < lower_sq)
+            in_range.append(distances[(distances >= lower_sq) & (distances <= upper_sq)])
+        return num_below, np.concatenate(in_range)
+
+    def pixel_points(self, t):
+        """
+        Get the x and y coordinates of the pixels in the object at timestep index t.
+
+        Returns:
+            (n, 2) array of x and y coordinates
+        """
+        if ("pixel_points", t) not in self.cache.keys():
+            in_mask = self.masks[t].ravel() == 1
+            self.cache[("pixel_points", t)] = np.stack([np.asarray(self.x[t]).ravel()[in_mask],
+                                                        np.asarray(self.y[t]).ravel()[in_mask]], axis=-1)
+        return self.cache[("pixel_points", t)]
+
+    def pixel_tree(self, t):
+        """
+        Get a KD-tree of the pixel coordinates at timestep index t.
+        """
+        if ("pixel_tree", t) not in self.cache.keys():
+            self.cache[("pixel_tree", t)] = cKDTree(self.pixel_points(t))
+        return self.cache[("pixel_tree", t)]
 
     def trajectory(self):
         """
@@ -146,10 +383,12 @@ class STObject(object):
         Returns:
 
         """
-        traj = np.zeros((2, self.times.size))
-        for t, time in enumerate(self.times):
-            traj[:, t] = self.center_of_mass(time)
-        return traj
+        if "trajectory" not in self.cache.keys():
+            traj = np.zeros((2, self.times.size))
+            for t, time in enumerate(self.times):
+                traj[:, t] = self.center_of_mass(time)
+            self.cache["trajectory"] = traj
+        return self.cache["trajectory"].copy()
 
     def get_corner(self, time):
         """
@@ -179,10 +418,18 @@ class STObject(object):
             size of the object in pixels
         """
         if self.start_time <= time <= self.end_time:
-            return self.masks[time - self.start_time].sum()
+            return self.step_size(time - self.start_time)
         else:
             return 0
 
+    def step_size(self, t):
+        """
+        Gets the size of the object at timestep index t.
+        """
+        if ("size", t) not in self.cache.keys():
+            self.cache[("size", t)] = self.masks[t].sum()
+        return self.cache[("size", t)]
+
     def max_size(self):
         """
         Gets the largest size of the object over all timesteps.
@@ -190,8 +437,10 @@ class STObject(object):
         Returns:
             Maximum size of the object in pixels
         """
-        sizes = np.array([m.sum() for m in self.masks])
-        return sizes.max()
+        if "max_size" not in self.cache.keys():
+            sizes = np.array([self.step_size(t) for t in range(len(self.timesteps))])
+            self.cache["max_size"] = sizes.max()
+        return self.cache["max_size"]
 
     def max_intensity(self, time):
         """
@@ -208,39 +457,65 @@ class STObject(object):
         Args:
             step: another STObject being added after the current one in time.
         """
+        if self.corners is not None:
+            corners, packed_masks = step.compact_steps()
+            self.corners.extend(corners)
+            self.packed_masks.extend(packed_masks)
+        else:
+            self.masks.extend(step.masks)
+            self.x.extend(step.x)
+            self.y.extend(step.y)
+            self.i.extend(step.i)
+            self.j.extend(step.j)
         self.timesteps.extend(step.timesteps)
-        self.masks.extend(step.masks)
-        self.x.extend(step.x)
-        self.y.extend(step.y)
-        self.i.extend(step.i)
-        self.j.extend(step.j)
         self.end_time = step.end_time
         self.times = np.arange(self.start_time, self.end_time + self.step, self.step)
         self.u = np.concatenate((self.u, step.u))
         self.v = np.concatenate((self.v, step.v))
+        self.clear_cache()
         for attr in self.attributes.keys():
             if attr in step.attributes.keys():
                 self.attributes[attr].extend(step.attributes[attr])
 
     def boundary_polygon(self, time):
         """
-        Get coordinates of object boundary in counter-clockwise order
+        Get coordinates of object boundary in counter-clockwise order. The boundary is the inner edge of the convex
+        hull of the mask. The coordinates are cached for each timestep.
         """
         ti = np.where(time == self.times)[0][0]
-        com_x, com_y = self.center_of_mass(time)
+        if ("boundary_polygon", ti) not in self.cache.keys():
+            self.cache[("boundary_polygon", ti)] = self.boundary_polygon_step(ti)
+        return self.cache[("boundary_polygon", ti)].copy()
+
+    def boundary_polygon_step(self, ti):
+        """
+        Calculate the coordinates of the object boundary at timestep index ti for boundary_polygon.
+        """
+        com_x, com_y = self.center_of_mass(self.times[ti])
         # If at least one point along perimeter of the mask rectangle is unmasked, find_boundaries() works.
         # But if all perimeter points are masked, find_boundaries() does not find the object.
         # Therefore, pad the mask with zeroes first and run find_boundaries on the padded array.
-        padded_mask = np.pad(self.masks[ti], 1, 'constant', constant_values=0)
-        chull = convex_hull_image(padded_mask)
-        boundary_image = find_boundaries(chull, mode='inner', background=0)
-        # Now remove the padding.
-        boundary_image = boundary_image[1:-1,1:-1]
-        boundary_x = self.x[ti].ravel()[boundary_image.ravel()]
-        boundary_y = self.y[ti].ravel()[boundary_image.ravel()]
+        mask = np.asarray(self.masks[ti])
+        padded_mask = np.zeros((mask.shape[0] + 2, mask.shape[1] + 2), dtype=mask.dtype)
+        padded_mask[1:-1, 1:-1] = mask
+        chull = np.zeros(padded_mask.shape, dtype=bool)
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if rows.size > 0:
+            # The hull is within the bounding box of the object, so only the box and its padding are searched.
+            box = (slice(rows[0], rows[-1] + 3), slice(cols[0], cols[-1] + 3))
+            chull[box] = convex_hull_image(padded_mask[box])
+        # Hull pixels with a background pixel above, below, left, or right of them, which are the inner boundaries
+        # found by find_boundaries. The padding keeps the hull away from the edges of the array.
+        interior = chull[1:-1, 1:-1] & chull[:-2, 1:-1] & chull[2:, 1:-1] & chull[1:-1, :-2] & chull[1:-1, 2:]
+        boundary_image = chull[1:-1, 1:-1] & ~interior
+        boundary_x = np.asarray(self.x[ti]).ravel()[boundary_image.ravel()]
+        boundary_y = np.asarray(self.y[ti]).ravel()[boundary_image.ravel()]
         r = np.sqrt((boundary_x - com_x) ** 2 + (boundary_y - com_y) ** 2)
         theta = np.arctan2((boundary_y - com_y), (boundary_x - com_x)) * 180.0 / np.pi + 360
-        polar_coords = np.array([(r[x], theta[x]) for x in range(r.size)], dtype=[('r', 'f4'), ('theta', 'f4')])
+        polar_coords = np.empty(r.size, dtype=[('r', 'f4'), ('theta', 'f4')])
+        polar_coords['r'] = r
+        polar_coords['theta'] = theta
         coord_order = np.argsort(polar_coords, order=['theta', 'r'])
         ordered_coords = np.vstack([boundary_x[coord_order], boundary_y[coord_order]])
         return ordered_coords
@@ -268,21 +543,29 @@ class STObject(object):
         min_error = 99999999999.0
         best_u = 0
         best_v = 0
-        for u in u_shifts:
-            j_shift = j_vals - u
-            for v in v_shifts:
-                i_shift = i_vals - v
-                if np.all((0 <= i_shift) & (i_shift < intensity_grid.shape[0]) &
-                                  (0 <= j_shift) & (j_shift < intensity_grid.shape[1])):
-                    shift_vals = intensity_grid[i_shift, j_shift]
-                else:
-                    shift_vals = np.zeros(i_shift.shape)
+        if obj_vals.size > 0:
+            # Shifts that move any pixel off the grid are compared against zeros.
+            errors = np.zeros((u_shifts.size, v_shifts.size))
+            errors[:] = np.abs(np.zeros(obj_vals.shape) - obj_vals).mean()
+            u_valid = np.flatnonzero((j_vals.min() - u_shifts >= 0) &
+                                     (j_vals.max() - u_shifts < intensity_grid.shape[1]))
+            v_valid = np.flatnonzero((i_vals.min() - v_shifts >= 0) &
+                                     (i_vals.max() - v_shifts < intensity_grid.shape[0]))
+            if u_valid.size > 0 and v_valid.size > 0:
                 # This isn't correlation; it is mean absolute error.
-                error = np.abs(shift_vals - obj_vals).mean()
-                if error < min_error:
-                    min_error = error
-                    best_u = u * self.dx
-                    best_v = v * self.dx
+                i_shift = i_vals[np.newaxis, :] - v_shifts[v_valid, np.newaxis]
+                chunk_size = max(1, 1000000 // (v_valid.size * obj_vals.size))
+                for c in range(0, u_valid.size, chunk_size):
+                    u_chunk = u_valid[c:c + chunk_size]
+                    j_shift = j_vals[np.newaxis, np.newaxis, :] - u_shifts[u_chunk, np.newaxis, np.newaxis]
+                    shift_vals = intensity_grid[i_shift[np.newaxis], j_shift]
+                    errors[u_chunk[:, np.newaxis], v_valid] = np.abs(shift_vals - obj_vals).mean(axis=-1)
+            # Shifts are searched in u-major order and the first minimum is kept.
+            best = np.argmin(np.where(np.isnan(errors), np.inf, errors))
+            if errors.flat[best] < min_error:
+                min_error = errors.flat[best]
+                best_u = u_shifts[best // v_shifts.size] * self.dx
+                best_v = v_shifts[best % v_shifts.size] * self.dx
         # 60 seems arbitrarily high
         #if min_error > 60:
         #    best_u = 0
@@ -294,19 +577,35 @@ class STObject(object):
     def count_overlap(self, time, other_object, other_time):
         """
         Counts the number of points that overlap between this STObject and another STObject. Used for tracking.
+        The sorted grid indices of each object's pixels are cached, so each count is a binary search of one set of
+        indices in the other.
         """
         ti = np.where(time == self.times)[0][0]
-        ma = np.where(self.masks[ti].ravel() == 1)
-        oti = np.where(other_time == other_object.times)[0]
-        obj_coords = np.zeros(self.masks[ti].sum(), dtype=[('x', int), ('y', int)])
-        other_obj_coords = np.zeros(other_object.masks[oti].sum(), dtype=[('x', int), ('y', int)])
-        obj_coords['x'] = self.i[ti].ravel()[ma]
-        obj_coords['y'] = self.j[ti].ravel()[ma]
-        other_obj_coords['x'] = other_object.i[oti][other_object.masks[oti] == 1]
-        other_obj_coords['y'] = other_object.j[oti][other_object.masks[oti] == 1]
-        return float(np.intersect1d(obj_coords,
-                                    other_obj_coords).size) / np.maximum(self.masks[ti].sum(),
-                                                                         other_object.masks[oti].sum())
+        oti = np.where(other_time == other_object.times)[0][0]
+        obj_index = self.pixel_index(ti)
+        other_obj_index = other_object.pixel_index(oti)
+        if obj_index.size == 0 or other_obj_index.size == 0 or obj_index[-1] < other_obj_index[0] or \
+                other_obj_index[-1] < obj_index[0]:
+            overlap = 0
+        else:
+            positions = np.minimum(np.searchsorted(other_obj_index, obj_index), other_obj_index.size - 1)
+            overlap = np.count_nonzero(other_obj_index[positions] == obj_index)
+        return float(overlap) / np.maximum(self.step_size(ti), other_object.step_size(oti))
+
+    def pixel_index(self, t):
+        """
+        Get the sorted, unique grid indices of the pixels in the object at timestep index t. Each (i, j) index is
+        stored as a single integer, i * 2 ** 32 + j, so the full model grid shape is not needed.
+
+        Returns:
+            Sorted array of integer pixel indices
+        """
+        if ("pixel_index", t) not in self.cache.keys():
+            in_mask = self.masks[t].ravel() == 1
+            index = np.asarray(self.i[t]).ravel()[in_mask].astype(np.int64) * 2 ** 32 + \
+                np.asarray(self.j[t]).ravel()[in_mask]
+            self.cache[("pixel_index", t)] = np.unique(index)
+        return self.cache[("pixel_index", t)]
 
     def extract_attribute_grid(self, model_grid, potential=False, future=False):
         """
@@ -396,19 +695,22 @@ class STObject(object):
         """
         ti = np.where(self.times == time)[0][0]
         ma = np.where(self.masks[ti].ravel() == 1)
-        if len(self.attributes[attribute][ti].ravel()[ma]) < 1:
+        values = self.attributes[attribute][ti].ravel()[ma]
+        if np.ma.isMaskedArray(values):
+            # Masked values are missing, so only the valid values are used.
+            values = values.compressed()
+        if len(values) < 1:
             stat_val = np.nan
             return stat_val
         if statistic in ['mean', 'max', 'min', 'std', 'ptp']:
-            stat_val = getattr(self.attributes[attribute][ti].ravel()[ma], statistic)()
+            stat_val = getattr(np, statistic)(values)
         elif statistic == 'median':
-            stat_val = np.median(self.attributes[attribute][ti].ravel()[ma])
+            stat_val = np.median(values)
         elif statistic == "skew":
-            stat_val = np.mean(self.attributes[attribute][ti].ravel()[ma]) - \
-                    np.median(self.attributes[attribute][ti].ravel()[ma])
+            stat_val = np.mean(values) - np.median(values)
         elif 'percentile' in statistic:
             per = int(statistic.split("_")[1])
-            stat_val = np.percentile(self.attributes[attribute][ti].ravel()[ma], per)
+            stat_val = np.percentile(values, per)
         elif 'dt' in statistic:
             stat_name = statistic[:-3]
             if ti == 0:
@@ -420,6 +722,111 @@ class STObject(object):
             stat_val = np.nan
         return stat_val
 
+    def calc_attribute_statistic_array(self, attributes, statistics):
+        """
+        Calculate every statistic of every attribute at every timestep. The values of each attribute within the mask
+        are stacked with the other attributes of the same dtype, and each statistic is calculated for all of them at
+        once. _dt statistics are differences of the statistics already calculated for each timestep. Attributes stored
+        as masked arrays with masked values are calculated with calc_attribute_statistic instead, since stacking the
+        values would drop the mask. The values are the same as those from calc_attribute_statistic.
+
+        Args:
+            attributes: List of attributes extracted from model grids
+            statistics: List of statistic names supported by calc_attribute_statistic
+
+        Returns:
+            Array of statistics with one row for each timestep and one column for each attribute and statistic, in
+            the order [attributes[0] + statistics[0], attributes[0] + statistics[1], ..., attributes[1] + statistics[0],
+            ...].
+        """
+        num_steps = self.times.size
+        masked_attributes = [a for a, attribute in enumerate(attributes)
+                             if any([np.ma.is_masked(step) for step in self.attributes[attribute]])]
+        empty = np.zeros(num_steps, dtype=bool)
+        step_values = []
+        for t in range(num_steps):
+            in_mask = self.masks[t].ravel() == 1
+            empty[t] = np.count_nonzero(in_mask) < 1
+            dtype_groups = {}
+            for a, attribute in enumerate(attributes):
+                if a in masked_attributes:
+                    continue
+                values = self.attributes[attribute][t].ravel()[in_mask]
+                if values.dtype not in dtype_groups.keys():
+                    dtype_groups[values.dtype] = ([], [])
+                dtype_groups[values.dtype][0].append(a)
+                dtype_groups[values.dtype][1].append(values)
+            step_values.append([(np.array(indices), np.stack(values)) for indices, values in dtype_groups.values()])
+        stat_arrays = {}
+        for statistic in statistics:
+            self.attribute_statistic_steps(statistic, step_values, empty, len(attributes), stat_arrays)
+        table = np.zeros((num_steps, len(attributes), len(statistics)))
+        for s, statistic in enumerate(statistics):
+            table[:, :, s] = stat_arrays[statistic][0]
+            for a in masked_attributes:
+                table[:, a, s] = [self.calc_attribute_statistic(attributes[a], statistic, time) for time in self.times]
+        return table.reshape(num_steps, len(attributes) * len(statistics))
+
+    def attribute_statistic_steps(self, statistic, step_values, empty, num_attributes, stat_arrays):
+        """
+        Calculate one statistic of all attributes at every timestep for calc_attribute_statistic_array. The dtype of
+        each value is kept so that differences for _dt statistics are calculated in the same precision as
+        calc_attribute_statistic.
+
+        Args:
+            statistic: Name of the statistic
+            step_values: List containing the (attribute indices, stacked masked values) of each dtype at each timestep
+            empty: Boolean array that is True for timesteps with no pixels in the mask
+            num_attributes: Number of attributes
+            stat_arrays: dict of the statistics already calculated. The new statistic is added to it.
+
+        Returns:
+            Array of the statistic with shape (timesteps, attributes), and an array of the dtype of each value, which
+            is None for values that are Python scalars.
+        """
+        if statistic in stat_arrays.keys():
+            return stat_arrays[statistic]
+        stat_array = np.zeros((len(step_values), num_attributes))
+        stat_dtypes = np.empty((len(step_values), num_attributes), dtype=object)
+        if statistic in ['mean', 'max', 'min', 'std', 'ptp', 'median', 'skew'] or 'percentile' in statistic:
+            for t, dtype_groups in enumerate(step_values):
+                if empty[t]:
+                    continue
+                for indices, values in dtype_groups:
+                    if statistic in ['mean', 'max', 'min', 'std', 'ptp']:
+                        group_stats = getattr(np, statistic)(values, axis=1)
+                    elif statistic == 'median':
+                        group_stats = np.median(values, axis=1)
+                    elif statistic == 'skew':
+                        group_stats = np.mean(values, axis=1) - np.median(values, axis=1)
+                    else:
+                        group_stats = np.percentile(values, int(statistic.split("_")[1]), axis=1)
+                    stat_array[t, indices] = group_stats
+                    stat_dtypes[t, indices] = group_stats.dtype
+        elif 'dt' in statistic:
+            base_array, base_dtypes = self.attribute_statistic_steps(statistic[:-3], step_values, empty,
+                                                                     num_attributes, stat_arrays)
+            for t in range(1, len(step_values)):
+                prev = np.where(self.times == self.times[t] - 1)[0][0]
+                for dtype_pair in set(zip(base_dtypes[t], base_dtypes[prev])):
+                    columns = np.array([(d, p) == dtype_pair for d, p in zip(base_dtypes[t], base_dtypes[prev])])
+                    current = base_array[t, columns]
+                    previous = base_array[prev, columns]
+                    if dtype_pair[0] is not None and dtype_pair[1] is not None:
+                        differences = current.astype(dtype_pair[0]) - previous.astype(dtype_pair[1])
+                        stat_dtypes[t, columns] = differences.dtype
+                    else:
+                        # Python scalars are 0 or nan, so the difference is exact and keeps the other dtype.
+                        differences = current - previous
+                        stat_dtypes[t, columns] = dtype_pair[0] if dtype_pair[0] is not None else dtype_pair[1]
+                    stat_array[t, columns] = differences
+        else:
+            stat_array[:] = np.nan
+        stat_array[empty] = np.nan
+        stat_dtypes[empty] = None
+        stat_arrays[statistic] = (stat_array, stat_dtypes)
+        return stat_arrays[statistic]
+
     def calc_timestep_statistic(self, statistic, time):
         """
         Calculate statistics from the primary attribute of the StObject.
@@ -484,9 +891,13 @@ class STObject(object):
         """
         ti = np.where(self.times == time)[0][0]
         shape_stats = []
-        try:
-            props = regionprops(self.masks[ti], self.timesteps[ti])[0]           
-        except:
+        if ("regionprops", ti) not in self.cache.keys():
+            try:
+                self.cache[("regionprops", ti)] = regionprops(self.masks[ti], self.timesteps[ti])[0]
+            except:
+                self.cache[("regionprops", ti)] = None
+        props = self.cache[("regionprops", ti)]
+        if props is None:
             for stat_name in stat_names:
                 shape_stats.append(np.nan)
             return shape_stats
@@ -504,7 +915,7 @@ class STObject(object):
                 shape_stats.append(props[stat_name])
         return shape_stats
 
-    def to_geojson(self, filename, proj, metadata=None):
+    def to_geojson(self, filename, proj, metadata=None, stream=False):
         """
         Output the data in the STObject to a geoJSON file.
 
@@ -512,17 +923,46 @@ class STObject(object):
             filename: Name of the file
             proj: PyProj object for converting the x and y coordinates back to latitude and longitue values.
             metadata: Metadata describing the object to be included in the top-level properties.
+            stream: If True, write each feature as it is created in compact form with write_feature_collection
+                instead of building the whole collection and writing it with indentation.
+        """
+        if stream:
+            write_feature_collection(filename, self.geojson_properties(metadata), self.geojson_features(proj))
+            return
+        json_obj = {"type": "FeatureCollection", "features": list(self.geojson_features(proj)),
+                    "properties": self.geojson_properties(metadata)}
+        file_obj = open(filename, "w")
+        json.dump(json_obj, file_obj, indent=1, sort_keys=True)
+        file_obj.close()
+        return
+
+    def geojson_properties(self, metadata=None):
+        """
+        Get the top-level geoJSON properties of the object.
+
+        Args:
+            metadata: dict of metadata describing the object.
+
+        Returns:
+            dict of properties
+        """
+        properties = {"times": self.times.tolist(), "dx": self.dx, "step": self.step, "u": self.u.tolist(),
+                      "v": self.v.tolist()}
+        if metadata is not None:
+            for k, v in metadata.items():
+                properties[k] = v
+        return properties
+
+    def geojson_features(self, proj):
+        """
+        Generate the geoJSON feature of each timestep. Each feature is created when it is requested.
+
+        Args:
+            proj: PyProj object for converting the x and y coordinates back to latitude and longitue values.
+
+        Yields:
+            dict containing the geoJSON feature
         """
-        if metadata is None:
-            metadata = {}
-        json_obj = {"type": "FeatureCollection", "features": [], "properties": {}}
-        json_obj['properties']['times'] = self.times.tolist()
-        json_obj['properties']['dx'] = self.dx
-        json_obj['properties']['step'] = self.step
-        json_obj['properties']['u'] = self.u.tolist()
-        json_obj['properties']['v'] = self.v.tolist()
-        for k, v in metadata.items():
-            json_obj['properties'][k] = v
         for t, time in enumerate(self.times):
             feature = {"type": "Feature",
                        "geometry": {"type": "Polygon"},
@@ -538,11 +978,91 @@ class STObject(object):
             feature["properties"]["attributes"] = {}
             for attr_name, steps in self.attributes.items():
                 feature["properties"]["attributes"][attr_name] = steps[t].tolist()
-            json_obj['features'].append(feature)
-        file_obj = open(filename, "w")
-        json.dump(json_obj, file_obj, indent=1, sort_keys=True)
-        file_obj.close()
-        return
+            yield feature
+
+
+class CompactSteps(object):
+    """
+    Read-only list of the masks, x, y, i, or j arrays of an STObject with compact storage. Each array is created from
+    the corner and bit-packed mask of its timestep when it is accessed.
+
+    Args:
+        st_object: STObject with compact storage
+        attr: name of the attribute
+    """
+    def __init__(self, st_object, attr):
+        self.st_object = st_object
+        self.attr = attr
+
+    def __len__(self):
+        return len(self.st_object.corners)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[t] for t in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Timestep index out of range")
+        return self.st_object.compact_step(self.attr, index)
+
+    def __iter__(self):
+        for t in range(len(self)):
+            yield self[t]
+
+
+def write_feature_collection(filename, properties, features):
+    """
+    Write a geoJSON FeatureCollection one feature at a time, so the whole collection is never held in memory. The
+    JSON is written without indentation or spaces between items.
+
+    Args:
+        filename: Name of the file
+        properties: dict of top-level properties
+        features: iterable of geoJSON feature dicts
+    """
+    separators = (",", ":")
+    with open(filename, "w") as file_obj:
+        file_obj.write('{"type":"FeatureCollection","properties":')
+        file_obj.write(json.dumps(properties, sort_keys=True, separators=separators))
+        file_obj.write(',"features":[')
+        for f, feature in enumerate(features):
+            if f > 0:
+                file_obj.write(",")
+            file_obj.write(json.dumps(feature, sort_keys=True, separators=separators))
+        file_obj.write("]}")
+    return
+
+
+def tracks_to_geojson(tracks, filename, proj, metadata=None, properties=None):
+    """
+    Write a set of STObjects, such as all of the tracks from one ensemble member, to one geoJSON FeatureCollection.
+    The top-level properties of each track are stored in order in the "tracks" list of the collection properties,
+    and each feature has a "track" property with the index of its track. Features are written as they are created.
+
+    Args:
+        tracks: List of STObjects
+        filename: Name of the file
+        proj: PyProj object for converting the x and y coordinates back to latitude and longitue values.
+        metadata: List of dicts containing metadata for each track
+        properties: dict of metadata describing the whole collection
+    """
+    if metadata is None:
+        metadata = [None] * len(tracks)
+    collection_properties = {}
+    if properties is not None:
+        collection_properties.update(properties)
+    collection_properties["tracks"] = [track.geojson_properties(track_meta)
+                                       for track, track_meta in zip(tracks, metadata)]
+
+    def track_features():
+        for t, track in enumerate(tracks):
+            for feature in track.geojson_features(proj):
+                feature["properties"]["track"] = t
+                yield feature
+    write_feature_collection(filename, collection_properties, track_features())
+    return
+
 
 def read_geojson(filename):
     """
@@ -557,10 +1077,44 @@ def read_geojson(filename):
     json_file = open(filename)
     data = json.load(json_file)
     json_file.close()
-    times = data["properties"]["times"]
+    return geojson_to_stobject(data["properties"], data["features"])
+
+
+def read_geojson_tracks(filename):
+    """
+    Reads a geoJSON file created by tracks_to_geojson.
+
+    Args:
+        filename: Name of the geoJSON file
+
+    Returns:
+        List of STObjects
+    """
+    json_file = open(filename)
+    data = json.load(json_file)
+    json_file.close()
+    track_features = [[] for track_properties in data["properties"]["tracks"]]
+    for feature in data["features"]:
+        track_features[feature["properties"]["track"]].append(feature)
+    return [geojson_to_stobject(track_properties, features)
+            for track_properties, features in zip(data["properties"]["tracks"], track_features)]
+
+
+def geojson_to_stobject(properties, features):
+    """
+    Initialize an STObject from the top-level properties and features of its geoJSON representation.
+
+    Args:
+        properties: dict of top-level properties created by STObject.geojson_properties
+        features: list of the feature of each timestep
+
+    Returns:
+        an STObject
+    """
+    times = properties["times"]
     main_data = dict(timesteps=[], masks=[], x=[], y=[], i=[], j=[])
     attribute_data = dict()
-    for feature in data["features"]:
+    for feature in features:
         for main_name in main_data.keys():
             main_data[main_name].append(np.array(feature["properties"][main_name]))
         for k, v in feature["properties"]["attributes"].items():
@@ -570,11 +1124,10 @@ def read_geojson(filename):
                 attribute_data[k].append(np.array(v))
     kwargs = {}
     for kw in ["dx", "step", "u", "v"]:
-        if kw in data["properties"].keys():
-            kwargs[kw] = data["properties"][kw]
+        if kw in properties.keys():
+            kwargs[kw] = properties[kw]
     sto = STObject(main_data["timesteps"], main_data["masks"], main_data["x"], main_data["y"],
                    main_data["i"], main_data["j"], times[0], times[-1], **kwargs)
     for k, v in attribute_data.items():
         sto.attributes[k] = v
     return sto
-
@@ -0,0 +1,205 @@
+import numpy as np
+from netCDF4 import Dataset
+from .STObject import STObject
+import json
+
+STEP_ARRAYS = ["timesteps", "masks", "x", "y", "i", "j"]
+# Pixel arrays are compressed in chunks of this many values so one track can be read without decompressing the others.
+PIXEL_CHUNK_SIZE = 65536
+
+
+def write_track_file(tracks, filename, metadata=None, file_metadata=None):
+    """
+    Write a set of STObjects, such as all of the tracks from one ensemble member and run date, to a single netCDF4
+    file. The arrays of every timestep are flattened and stored one after another in contiguous ragged arrays
+    following the CF conventions, so any track can be read without reading the others. The dtype of each array of
+    each track is stored so the tracks are read back unchanged.
+
+    Args:
+        tracks: List of STObjects. Every array of a timestep, including the attributes, must have the same shape.
+        filename: Name of the netCDF4 file
+        metadata: List of dicts containing metadata for each track. The dicts must be JSON serializable.
+        file_metadata: dict of global attributes added to the file.
+    """
+    if metadata is None:
+        metadata = [{}] * len(tracks)
+    if len(metadata) != len(tracks):
+        raise ValueError("The number of metadata dicts does not match the number of tracks")
+    attribute_names = []
+    for track in tracks:
+        for attribute in track.attributes.keys():
+            if attribute not in attribute_names:
+                attribute_names.append(attribute)
+    array_names = STEP_ARRAYS + ["attribute_{0:d}".format(a) for a in range(len(attribute_names))]
+    step_counts = np.array([track.times.size for track in tracks], dtype=np.int64)
+    step_shapes = np.zeros((step_counts.sum(), 2), dtype=np.int64)
+    step_times = np.zeros(step_counts.sum(), dtype=np.int64)
+    step_u = np.zeros(step_counts.sum())
+    step_v = np.zeros(step_counts.sum())
+    pixels = dict([(name, []) for name in array_names])
+    dtypes = dict([(name, []) for name in array_names])
+    s = 0
+    for track in tracks:
+        track_arrays = [getattr(track, name) for name in STEP_ARRAYS]
+        track_arrays += [track.attributes.get(attribute, None) for attribute in attribute_names]
+        for t in range(track.times.size):
+            step_shapes[s] = np.shape(track.masks[t])
+            step_times[s] = track.times[t]
+            step_u[s] = track.u[t]
+            step_v[s] = track.v[t]
+            for name, steps in zip(array_names, track_arrays):
+                if steps is None:
+                    # Tracks without an attribute are padded so the pixels of every array line up.
+                    pixels[name].append(np.zeros(step_shapes[s].prod(), dtype=np.uint8))
+                    continue
+                step_array = np.asarray(steps[t])
+                if step_array.shape != tuple(step_shapes[s]):
+                    raise ValueError("The {0} array of timestep {1:d} does not match the mask shape".format(name, t))
+                pixels[name].append(step_array.ravel())
+            s += 1
+        for name, steps in zip(array_names, track_arrays):
+            dtypes[name].append("" if steps is None else np.asarray(steps[0]).dtype.str)
+    out_file = Dataset(filename, "w")
+    out_file.createDimension("track", len(tracks))
+    out_file.createDimension("step", step_counts.sum())
+    out_file.createDimension("pixel", step_shapes.prod(axis=1).sum())
+    out_file.Conventions = "CF-1.6"
+    out_file.featureType = "trajectory"
+    out_file.attribute_names = json.dumps(attribute_names)
+    if file_metadata is not None:
+        for key, value in file_metadata.items():
+            setattr(out_file, key, value)
+    step_count = out_file.createVariable("step_count", "i8", ("track",))
+    step_count[:] = step_counts
+    step_count.sample_dimension = "step"
+    step_count.long_name = "number of timesteps in each track"
+    for name, values in [("start_time", [track.start_time for track in tracks]),
+                         ("end_time", [track.end_time for track in tracks]),
+                         ("step", [track.step for track in tracks])]:
+        var_obj = out_file.createVariable(name, "i8", ("track",))
+        var_obj[:] = np.array(values, dtype=np.int64)
+    dx = out_file.createVariable("dx", "f8", ("track",))
+    dx[:] = np.array([track.dx for track in tracks], dtype=float)
+    track_metadata = out_file.createVariable("metadata", str, ("track",))
+    for t, track_meta in enumerate(metadata):
+        track_metadata[t] = json.dumps(track_meta)
+    for name, values in [("time", step_times), ("u", step_u), ("v", step_v)]:
+        var_obj = out_file.createVariable(name, values.dtype, ("step",))
+        var_obj[:] = values
+    pixel_count = out_file.createVariable("pixel_count", "i8", ("step",))
+    pixel_count[:] = step_shapes.prod(axis=1)
+    pixel_count.sample_dimension = "pixel"
+    for name, size in [("rows", step_shapes[:, 0]), ("columns", step_shapes[:, 1])]:
+        var_obj = out_file.createVariable(name, "i8", ("step",))
+        var_obj[:] = size
+    for name in array_names:
+        track_dtypes = out_file.createVariable(name + "_dtype", str, ("track",))
+        for t, dtype in enumerate(dtypes[name]):
+            track_dtypes[t] = dtype
+        if len(pixels[name]) > 0:
+            values = np.concatenate(pixels[name])
+        else:
+            values = np.zeros(0)
+        if values.dtype == bool:
+            values = values.astype(np.uint8)
+        var_obj = out_file.createVariable(name, values.dtype, ("pixel",), zlib=True,
+                                          chunksizes=(min(max(values.size, 1), PIXEL_CHUNK_SIZE),))
+        var_obj[:] = values
+    out_file.close()
+    return
+
+
+def read_track_file(filename):
+    """
+    Read all of the STObjects in a track file created by write_track_file.
+
+    Args:
+        filename: Name of the netCDF4 file
+
+    Returns:
+        List of STObjects
+    """
+    with TrackFile(filename) as track_file:
+        tracks = [track_file[t] for t in range(len(track_file))]
+    return tracks
+
+
+class TrackFile(object):
+    """
+    Lazy reader for track files created by write_track_file. Only the index of timesteps and pixels is read when the
+    file is opened, and each STObject is read from the file when it is accessed.
+
+    Args:
+        filename: Name of the netCDF4 file
+
+    Attributes:
+        attribute_names: Names of the attributes stored in the file
+        step_offsets: Index of the first timestep of each track, with the total number of timesteps at the end
+        pixel_offsets: Index of the first pixel of each timestep, with the total number of pixels at the end
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.dataset = Dataset(filename)
+        self.dataset.set_auto_mask(False)
+        self.attribute_names = json.loads(self.dataset.attribute_names)
+        self.array_names = STEP_ARRAYS + ["attribute_{0:d}".format(a) for a in range(len(self.attribute_names))]
+        self.step_offsets = np.concatenate([[0], np.cumsum(self.dataset.variables["step_count"][:])])
+        self.pixel_offsets = np.concatenate([[0], np.cumsum(self.dataset.variables["pixel_count"][:])])
+        self.step_shapes = np.stack([self.dataset.variables["rows"][:], self.dataset.variables["columns"][:]], axis=1)
+
+    def __len__(self):
+        return self.step_offsets.size - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Track index out of range")
+        variables = self.dataset.variables
+        first_step, last_step = self.step_offsets[index], self.step_offsets[index + 1]
+        first_pixel, last_pixel = self.pixel_offsets[first_step], self.pixel_offsets[last_step]
+        step_arrays = {}
+        for name in self.array_names:
+            dtype = variables[name + "_dtype"][index]
+            if dtype == "":
+                continue
+            values = variables[name][first_pixel:last_pixel].astype(np.dtype(dtype))
+            step_arrays[name] = []
+            for s in range(first_step, last_step):
+                start = self.pixel_offsets[s] - first_pixel
+                step_arrays[name].append(values[start:start + self.pixel_offsets[s + 1] - self.pixel_offsets[s]]
+                                         .reshape(self.step_shapes[s]))
+        track = STObject(*[step_arrays[name] for name in STEP_ARRAYS],
+                         int(variables["start_time"][index]), int(variables["end_time"][index]),
+                         step=int(variables["step"][index]), dx=variables["dx"][index],
+                         u=variables["u"][first_step:last_step], v=variables["v"][first_step:last_step])
+        for a, attribute in enumerate(self.attribute_names):
+            if "attribute_{0:d}".format(a) in step_arrays.keys():
+                track.attributes[attribute] = step_arrays["attribute_{0:d}".format(a)]
+        return track
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def metadata(self, index):
+        """
+        Get the metadata of one track.
+
+        Args:
+            index: Index of the track in the file
+
+        Returns:
+            dict of metadata
+        """
+        return json.loads(self.dataset.variables["metadata"][index])
+
+    def close(self):
+        self.dataset.close()
+        return
@@ -11,6 +11,7 @@ from sklearn.linear_model import LinearRegression
 from hagelslag.evaluation.ProbabilityMetrics import DistributedROC
 from os.path import join
 from hagelslag.util.make_proj_grids import read_arps_map_file, read_ncar_map_file
+from hagelslag.processing.STObject import write_feature_collection
 from sklearn.model_selection import KFold
 
 class TrackModeler(object):
@@ -811,8 +812,7 @@ class TrackModeler(object):
                     except OSError:
                         print("directory already created")
             out_json_filename = out_path + "/".join(full_path) + "/" + json_file_name
-            with open(out_json_filename, "w") as out_json_obj:
-                json.dump(track_obj, out_json_obj, indent=1, sort_keys=True)
+            write_feature_collection(out_json_filename, track_obj["properties"], track_obj["features"])
         return
 
     def output_forecasts_csv(self, forecasts, mode, csv_path, run_date_format="%Y%m%d-%H%M"):
@@ -918,9 +918,7 @@ def output_forecast(step_forecasts, run_date, ensemble_name, member, track_num,
                 print("directory already created")
     out_json_filename = out_path + "/".join(full_path) + "/" + json_file_name
     try:
-        out_json_obj = open(out_json_filename, "w")
-        json.dump(track_obj, out_json_obj, indent=1, sort_keys=True)
-        out_json_obj.close()
+        write_feature_collection(out_json_filename, track_obj["properties"], track_obj["features"])
     except IOError:
         print(out_json_filename + " not found")
         return
@@ -6,10 +6,12 @@ from hagelslag.processing.Hysteresis import Hysteresis
 from hagelslag.processing.tracker import label_storm_objects, extract_storm_patches, track_storms
 from .ObjectMatcher import ObjectMatcher, TrackMatcher, TrackStepMatcher
 from scipy.ndimage import find_objects, gaussian_filter
-from .STObject import STObject, read_geojson
+from .STObject import STObject, read_geojson, read_geojson_tracks
+from .TrackFile import read_track_file
 import numpy as np
 from scipy.interpolate import interp1d
 from glob import glob
+from os.path import exists
 import pandas as pd
 from datetime import timedelta
 from scipy.stats import gamma
@@ -45,6 +47,9 @@ class TrackProcessor(object):
             segmentation parameters are used.
         single_step: Whether model timesteps are in separate files or aggregated into one file.
         mask_file: netCDF filename containing a mask of valid grid points on the model domain.
+        patch_radius: Number of grid points from center of mass to extract for patch tracks.
+        compact_objects: If True, model and MRMS objects store bit-packed masks and corners into the model grid
+            instead of copies of their masks and coordinates. See STObject.compress.
     """
     def __init__(self,
                  run_date,
@@ -67,7 +72,8 @@ class TrackProcessor(object):
                  mrms_watershed_params=None,
                  single_step=True,
                  mask_file=None,
-                 patch_radius=32):
+                 patch_radius=32,
+                 compact_objects=False):
         self.run_date = run_date
         self.start_date = start_date
         self.end_date = end_date
@@ -122,6 +128,7 @@ class TrackProcessor(object):
             self.mask = mask_data.variables["usa_mask"][:]
             mask_data.close()
         self.patch_radius = patch_radius
+        self.compact_objects = compact_objects
         return
 
     def find_model_patch_tracks(self):
@@ -175,7 +182,8 @@ class TrackProcessor(object):
             model_objects.extend(extract_storm_patches(hour_labels, model_data, self.model_grid.x,
                                                        self.model_grid.y, [hour],
                                                        dx=self.model_grid.dx,
-                                                       patch_radius=self.patch_radius))
+                                                       patch_radius=self.patch_radius,
+                                                       compact=self.compact_objects))
             for model_obj in model_objects[-1]:
                 slices = list(find_objects(model_obj.masks[-1]))
                 if len(slices) > 0:
@@ -257,6 +265,8 @@ class TrackProcessor(object):
                                                       hour,
                                                       hour,
                                                       dx=self.model_grid.dx))
+                    if self.compact_objects:
+                        model_objects[-1][-1].compress(self.model_grid.x, self.model_grid.y)
                     if h > 0:
                         dims = model_objects[-1][-1].timesteps[0].shape
                         model_objects[-1][-1].estimate_motion(hour, self.model_grid.data[h-1], dims[1], dims[0])
@@ -287,6 +297,13 @@ class TrackProcessor(object):
         return tracked_model_objects
 
     def load_model_tracks(self, json_path):
+        track_filename = json_path + "{0}/{1}/{2}_{0}_{1}_model_tracks.nc".format(self.run_date.strftime("%Y%m%d"),
+                                                                                 self.ensemble_member,
+                                                                                 self.ensemble_name)
+        if exists(track_filename):
+            return read_track_file(track_filename)
+        if exists(track_filename[:-3] + ".json"):
+            return read_geojson_tracks(track_filename[:-3] + ".json")
         model_track_files = sorted(glob(json_path + "{0}/{1}/{2}_*.json".format(self.run_date.strftime("%Y%m%d"),
                                                                                 self.ensemble_member,
                                                                                 self.ensemble_name)))
@@ -295,8 +312,29 @@ class TrackProcessor(object):
             model_tracks.append(read_geojson(model_track_file))
         return model_tracks
 
-    def load_mrms_tracks(self, json_path, mrms_name="mesh"):
-        mrms_track_files = sorted(glob(json_path + "{0}/{1}/{2}_*.json".format(self.run_date.strftime("%Y%m%d"),
+    def load_mrms_tracks(self, json_path, mrms_name="mesh", run_date_format="%Y%m%d"):
+        """
+        Load the observed tracks of the run date and member from the netCDF4 track file, the geoJSON collection, or
+        the separate geoJSON track files, whichever is found first.
+
+        Args:
+            json_path: Path to the directory containing the run date directories.
+            mrms_name: Name of the observed variable used as the prefix of the file names.
+            run_date_format: Format of the run date in the directory and file names.
+
+        Returns:
+            List of STObjects
+        """
+        track_filename = obs_track_filename(json_path, self.run_date, self.ensemble_member,
+                                            run_date_format=run_date_format, mrms_name=mrms_name)
+        collection_filename = obs_track_filename(json_path, self.run_date, self.ensemble_member,
+                                                 run_date_format=run_date_format, mrms_name=mrms_name,
+                                                 extension=".json")
+        if exists(track_filename):
+            return read_track_file(track_filename)
+        if exists(collection_filename):
+            return read_geojson_tracks(collection_filename)
+        mrms_track_files = sorted(glob(json_path + "{0}/{1}/{2}_*.json".format(self.run_date.strftime(run_date_format),
                                                                                self.ensemble_member,
                                                                                mrms_name)))
         mrms_tracks = []
@@ -343,6 +381,8 @@ class TrackProcessor(object):
                                                         hour,
                                                         hour,
                                                         dx=self.model_grid.dx))
+                        if self.compact_objects:
+                            obs_objects[-1][-1].compress(self.model_grid.x, self.model_grid.y)
                         if h > 0:
                             dims = obs_objects[-1][-1].timesteps[0].shape
                             obs_objects[-1][-1].estimate_motion(hour, self.mrms_grid.data[h-1], dims[1], dims[0])
@@ -614,3 +654,22 @@ class TrackProcessor(object):
             track_errors.loc[pair[0], 'end_time_difference'] = model_track.end_time - obs_track.end_time 
         return track_errors
 
+
+def obs_track_filename(json_path, run_date, member, run_date_format="%Y%m%d", mrms_name="mesh", extension=".nc"):
+    """
+    Get the name of the file storing all of the observed tracks of a run date and member. The same name is used when
+    hsdata writes the file and when TrackProcessor.load_mrms_tracks reads it.
+
+    Args:
+        json_path: Path to the directory containing the run date directories.
+        run_date: Datetime of the run
+        member: Name of the ensemble member
+        run_date_format: Format of the run date in the directory and file names.
+        mrms_name: Name of the observed variable used as the prefix of the file name.
+        extension: ".nc" for the netCDF4 track file or ".json" for the geoJSON collection
+
+    Returns:
+        Name of the track file
+    """
+    return json_path + "{0}/{1}/{2}_{0}_{1}_obs_tracks{3}".format(run_date.strftime(run_date_format), member,
+                                                                  mrms_name, extension)
@@ -1,6 +1,6 @@
 from skimage.morphology import watershed
-from scipy.ndimage import label, find_objects
-import numpy as np
+from scipy.ndimage import label
+from .size_filter import size_filter
 
 
 class Watershed(object):
@@ -34,13 +34,4 @@ class Watershed(object):
         Returns:
             Labeled array with re-numbered objects to account for those that have been removed
         """
-        out_grid = np.zeros(labeled_grid.shape, dtype=int)
-        slices = find_objects(labeled_grid)
-        j = 1
-        for i, s in enumerate(slices):
-            box = labeled_grid[s]
-            size = np.count_nonzero(box == i + 1)
-            if size >= min_size and box.shape[0] > 1 and box.shape[1] > 1:
-                out_grid[np.where(labeled_grid == i + 1)] = j
-                j += 1
-        return out_grid
+        return size_filter(labeled_grid, min_size)
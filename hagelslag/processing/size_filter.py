@@ -0,0 +1,30 @@
+import numpy as np
+from scipy.ndimage import find_objects
+
+
+def size_filter(labeled_grid, min_size):
+    """
+    Removes labeled objects that are smaller than min_size or only one pixel wide or tall, and relabels the remaining
+    objects in order. Object areas are found with one pass over the grid, and the grid is relabeled through a lookup
+    table.
+
+    Args:
+        labeled_grid: 2D grid of integer labels. Values less than 1 are treated as background.
+        min_size: Minimum object size in pixels.
+    Returns:
+        Labeled array with re-numbered objects to account for those that have been removed
+    """
+    labels = np.where(labeled_grid > 0, labeled_grid, 0)
+    num_labels = int(labels.max()) if labels.size > 0 else 0
+    if num_labels == 0:
+        return np.zeros(labeled_grid.shape, dtype=int)
+    sizes = np.bincount(labels.ravel(), minlength=num_labels + 1)[1:]
+    keep = sizes >= min_size
+    for l, obj_slice in enumerate(find_objects(labels)):
+        if obj_slice is None:
+            keep[l] = False
+        elif obj_slice[0].stop - obj_slice[0].start < 2 or obj_slice[1].stop - obj_slice[1].start < 2:
+            keep[l] = False
+    relabel = np.zeros(num_labels + 1, dtype=int)
+    relabel[1:][keep] = np.arange(1, np.count_nonzero(keep) + 1)
+    return relabel[labels]
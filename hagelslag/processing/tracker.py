@@ -4,11 +4,12 @@ from .Watershed import Watershed
 from .Hysteresis import Hysteresis
 from hagelslag.processing.ObjectMatcher import ObjectMatcher
 from scipy.ndimage import find_objects, center_of_mass, gaussian_filter
+from multiprocessing import Pool
 import numpy as np
 
 
 def label_storm_objects(data, method, min_intensity, max_intensity, min_area=1, max_area=100, max_range=1,
-                        increment=1, gaussian_sd=0):
+                        increment=1, gaussian_sd=0, num_workers=1, tile_size=None, halo=50):
     """
     From a 2D grid or time series of 2D grids, this method labels storm objects with either the Enhanced Watershed,
     Watershed, or Hysteresis methods.
@@ -26,9 +27,17 @@ def label_storm_objects(data, method, min_intensity, max_intensity, min_area=1,
         max_range: Maximum difference in bins for search before growth is stopped.
         increment: Discretization increment for the enhanced watershed
         gaussian_sd: Standard deviation of Gaussian filter applied to data
+        num_workers: (default 1) Number of processes used to label the time steps of a 3D array. The data are shared
+            with the processes through shared memory.
+        tile_size: (default None) If set, each grid is labeled in square tiles with this many grid points on a side
+            to limit peak memory. Only supported for hysteresis. See label_tiled_time_slice.
+        halo: (default 50) Number of grid points each tile overlaps its neighbors when tile_size is set. Hysteresis
+            objects smaller than the halo are identical to the objects found by labeling the full domain.
     Returns:
         label_grid: an ndarray with the same shape as data in which each pixel is labeled with a positive integer value.
     """
+    if tile_size is not None and method.lower() in ["ew", "ws"]:
+        raise ValueError("Tiled labeling is only supported for hysteresis, not " + method)
     if method.lower() == "ew":
         labeler = EnhancedWatershed(min_intensity, increment, max_intensity, max_area, max_range)
     elif method.lower() == "ws":
@@ -36,28 +45,168 @@ def label_storm_objects(data, method, min_intensity, max_intensity, min_area=1,
     else:
         labeler = Hysteresis(min_intensity, max_intensity)
     if len(data.shape) == 2:
-        if gaussian_sd > 0:
-            label_grid = labeler.label(gaussian_filter(data, gaussian_sd))
-        else:
-            label_grid = labeler.label(data)
-        label_grid[data < min_intensity] = 0
-        if min_area > 1:
-            label_grid = labeler.size_filter(label_grid, min_area)
+        label_grid = label_time_slice(data, labeler, min_intensity, min_area, gaussian_sd, tile_size, halo)
+    elif num_workers > 1 and data.shape[0] > 1:
+        label_grid = label_shared_time_slices(data, labeler, min_intensity, min_area, gaussian_sd, num_workers,
+                                              tile_size, halo)
     else:
         label_grid = np.zeros(data.shape, dtype=np.int32)
         for t in range(data.shape[0]):
-            if gaussian_sd > 0:
-                label_grid[t] = labeler.label(gaussian_filter(data[t], gaussian_sd))
-            else:
-                label_grid[t] = labeler.label(data[t])
-            label_grid[t][data[t] < min_intensity] = 0
-            if min_area > 1:
-                label_grid[t] = labeler.size_filter(label_grid[t], min_area)
+            label_grid[t] = label_time_slice(data[t], labeler, min_intensity, min_area, gaussian_sd, tile_size, halo)
     print("Found {0:02d}".format(int(label_grid.max())) + " storm objects.")
     return label_grid
 
 
-def extract_storm_objects(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, obj_buffer=0):
+def label_time_slice(data, labeler, min_intensity, min_area=1, gaussian_sd=0, tile_size=None, halo=50):
+    """
+    Label a single 2D grid and apply the intensity and size filters.
+
+    Args:
+        data: 2D array being labeled
+        labeler: EnhancedWatershed, Watershed, or Hysteresis object
+        min_intensity: Minimum intensity threshold for gridpoints contained within any objects
+        min_area: The minimum area of any object in pixels.
+        gaussian_sd: Standard deviation of Gaussian filter applied to data
+        tile_size: If set and the grid is larger than one tile, label the grid in tiles.
+        halo: Number of grid points of overlap between tiles.
+
+    Returns:
+        2D array of labels
+    """
+    if tile_size is not None and max(data.shape) > tile_size:
+        return label_tiled_time_slice(data, labeler, min_intensity, min_area, gaussian_sd, tile_size, halo)
+    if gaussian_sd > 0:
+        label_grid = labeler.label(gaussian_filter(data, gaussian_sd))
+    else:
+        label_grid = labeler.label(data)
+    label_grid[data < min_intensity] = 0
+    if min_area > 1:
+        label_grid = labeler.size_filter(label_grid, min_area)
+    return label_grid
+
+
+def label_tiled_time_slice(data, labeler, min_intensity, min_area, gaussian_sd, tile_size, halo):
+    """
+    Label a 2D grid in overlapping tiles so that the segmentation arrays only need to cover one tile at a time.
+    Each tile is labeled together with a halo of grid points around it. An object is assigned to the tile
+    whose core (the tile without its halo) contains the first pixel of the object in row-major order, and pixels
+    claimed by an object from an earlier tile are not overwritten. Objects that fit within the halo are therefore
+    labeled in full by the tile that owns them. Larger objects may be cut at the edge of the halo.
+
+    Only hysteresis is supported. A hysteresis object depends only on the pixels connected to it, but the enhanced
+    watershed and watershed objects depend on the centers and basins found over the whole domain, so labeling a
+    tile can give different objects even far from the edge of the halo.
+
+    Args:
+        data: 2D array being labeled
+        labeler: Hysteresis object
+        min_intensity: Minimum intensity threshold for gridpoints contained within any objects
+        min_area: The minimum area of any object in pixels.
+        gaussian_sd: Standard deviation of Gaussian filter applied to data
+        tile_size: Number of grid points on each side of a tile, not including the halo.
+        halo: Number of grid points of overlap between tiles.
+
+    Returns:
+        2D int32 array of labels numbered in tile order
+    """
+    if not isinstance(labeler, Hysteresis):
+        raise ValueError("Tiled labeling is only supported for hysteresis, not " + type(labeler).__name__)
+    label_grid = np.zeros(data.shape, dtype=np.int32)
+    num_objects = 0
+    for i_start in range(0, data.shape[0], tile_size):
+        for j_start in range(0, data.shape[1], tile_size):
+            window = (slice(max(i_start - halo, 0), min(i_start + tile_size + halo, data.shape[0])),
+                      slice(max(j_start - halo, 0), min(j_start + tile_size + halo, data.shape[1])))
+            tile_labels = label_time_slice(data[window], labeler, min_intensity, min_area, gaussian_sd)
+            flat_labels = tile_labels.ravel()
+            object_pixels = np.flatnonzero(flat_labels > 0)
+            if object_pixels.size == 0:
+                continue
+            tile_objects, first_pixels = np.unique(flat_labels[object_pixels], return_index=True)
+            first_i, first_j = np.unravel_index(object_pixels[first_pixels], tile_labels.shape)
+            first_i += window[0].start
+            first_j += window[1].start
+            owned = (first_i >= i_start) & (first_i < i_start + tile_size) & \
+                    (first_j >= j_start) & (first_j < j_start + tile_size)
+            relabel = np.zeros(tile_labels.max() + 1, dtype=np.int32)
+            relabel[tile_objects[owned]] = np.arange(num_objects + 1, num_objects + np.count_nonzero(owned) + 1)
+            num_objects += np.count_nonzero(owned)
+            tile_output = relabel[tile_labels]
+            window_grid = label_grid[window]
+            unclaimed = (tile_output > 0) & (window_grid == 0)
+            window_grid[unclaimed] = tile_output[unclaimed]
+    if min_area > 1:
+        label_grid = labeler.size_filter(label_grid, min_area).astype(np.int32)
+    return label_grid
+
+
+def label_shared_time_slices(data, labeler, min_intensity, min_area, gaussian_sd, num_workers, tile_size=None,
+                             halo=50):
+    """
+    Label each time step of a 3D array in a pool of processes. The input data and output labels are stored in shared
+    memory so that they are not copied to each process, and each process writes its labels directly into the output.
+
+    Args:
+        data: 3D array in (time, y, x) coordinate order
+        labeler: EnhancedWatershed, Watershed, or Hysteresis object
+        min_intensity: Minimum intensity threshold for gridpoints contained within any objects
+        min_area: The minimum area of any object in pixels.
+        gaussian_sd: Standard deviation of Gaussian filter applied to data
+        num_workers: Number of processes
+        tile_size: If set, label each time step in tiles of this size.
+        halo: Number of grid points of overlap between tiles.
+
+    Returns:
+        3D int32 array of labels in the same time order as data
+    """
+    # shared_memory is only available in Python 3.8 and later
+    from multiprocessing import shared_memory
+    data = np.ascontiguousarray(data)
+    data_shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+    label_shm = shared_memory.SharedMemory(create=True, size=max(data.size * np.dtype(np.int32).itemsize, 1))
+    try:
+        shared_data = np.ndarray(data.shape, dtype=data.dtype, buffer=data_shm.buf)
+        shared_data[:] = data
+        shared_labels = np.ndarray(data.shape, dtype=np.int32, buffer=label_shm.buf)
+        pool = Pool(min(num_workers, data.shape[0]))
+        try:
+            pool.starmap(label_shared_time_slice, [(t, data_shm.name, label_shm.name, data.shape, data.dtype.str,
+                                                    labeler, min_intensity, min_area, gaussian_sd, tile_size, halo)
+                                                   for t in range(data.shape[0])])
+        finally:
+            pool.close()
+            pool.join()
+        label_grid = np.array(shared_labels)
+        del shared_data, shared_labels
+    finally:
+        data_shm.close()
+        data_shm.unlink()
+        label_shm.close()
+        label_shm.unlink()
+    return label_grid
+
+
+def label_shared_time_slice(t, data_name, label_name, shape, dtype, labeler, min_intensity, min_area, gaussian_sd,
+                            tile_size=None, halo=50):
+    """
+    Label one time step of data stored in shared memory and write the labels to shared memory. Called by
+    label_shared_time_slices in each process.
+    """
+    from multiprocessing import shared_memory
+    data_shm = shared_memory.SharedMemory(name=data_name)
+    label_shm = shared_memory.SharedMemory(name=label_name)
+    try:
+        data = np.ndarray(shape, dtype=dtype, buffer=data_shm.buf)
+        label_grid = np.ndarray(shape, dtype=np.int32, buffer=label_shm.buf)
+        label_grid[t] = label_time_slice(data[t], labeler, min_intensity, min_area, gaussian_sd, tile_size, halo)
+        del data, label_grid
+    finally:
+        data_shm.close()
+        label_shm.close()
+    return
+
+
+def extract_storm_objects(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, obj_buffer=0, compact=False):
     """
     After storms are labeled, this method extracts the storm objects from the grid and places them into STObjects.
     The STObjects contain intensity, location, and shape information about each storm at each timestep.
@@ -71,6 +220,8 @@ def extract_storm_objects(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, o
         dx: grid spacing in same units as x_grid and y_grid.
         dt: period elapsed between times
         obj_buffer: number of extra pixels beyond bounding box of object to store in each STObject
+        compact: If True, store the STObjects with bit-packed masks and corners into x_grid and y_grid instead of
+            copies of the masks and coordinates. See STObject.compress.
 
     Returns:
         storm_objects: list of lists containing STObjects identified at each time.
@@ -99,6 +250,8 @@ def extract_storm_objects(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, o
                                                       time,
                                                       dx=dx,
                                                       step=dt))
+                    if compact:
+                        storm_objects[-1][-1].compress(x_grid, y_grid)
                     if t > 0:
                         dims = storm_objects[-1][-1].timesteps[0].shape
                         storm_objects[-1][-1].estimate_motion(time, data[t - 1], dims[1], dims[0])
@@ -124,10 +277,12 @@ def extract_storm_objects(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, o
                                                   times,
                                                   dx=dx,
                                                   step=dt))
+                if compact:
+                    storm_objects[-1][-1].compress(x_grid, y_grid)
     return storm_objects
 
 
-def extract_storm_patches(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, patch_radius=16):
+def extract_storm_patches(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, patch_radius=16, compact=False):
     """
     After storms are labeled, this method extracts boxes of equal size centered on each storm from the grid and places
     them into STObjects. The STObjects contain intensity, location, and shape information about each storm
@@ -142,6 +297,8 @@ def extract_storm_patches(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, p
         dx: grid spacing in same units as x_grid and y_grid.
         dt: period elapsed between times
         patch_radius: Number of grid points from center of mass to extract
+        compact: If True, store the STObjects with bit-packed masks and corners into x_grid and y_grid instead of
+            copies of the masks and coordinates. See STObject.compress.
 
     Returns:
         storm_objects: list of lists containing STObjects identified at each time.
@@ -168,6 +325,8 @@ def extract_storm_patches(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, p
                                                       time,
                                                       dx=dx,
                                                       step=dt))
+                    if compact:
+                        storm_objects[-1][-1].compress(x_grid, y_grid)
                     if t > 0:
                         dims = storm_objects[-1][-1].timesteps[0].shape
                         storm_objects[-1][-1].estimate_motion(time, data[t - 1], dims[1], dims[0])
@@ -191,17 +350,20 @@ def extract_storm_patches(label_grid, data, x_grid, y_grid, times, dx=1, dt=1, p
                                                   times[0],
                                                   dx=dx,
                                                   step=dt))
+                if compact:
+                    storm_objects[-1][-1].compress(x_grid, y_grid)
     return storm_objects
 
 
 def track_storms(storm_objects, times, distance_components, distance_maxima, distance_weights, tracked_objects=None):
     """
     Given the output of extract_storm_objects, this method tracks storms through time and merges individual
-    STObjects into a set of tracks.
+    STObjects into a set of tracks. The tracks that can still be extended are indexed by the time of their next step,
+    so each step only matches against the tracks that ended at the previous step.
 
     Args:
         storm_objects: list of list of STObjects that have not been tracked.
-        times: List of times associated with each set of STObjects
+        times: List of increasing times associated with each set of STObjects
         distance_components: list of function objects that make up components of distance function
         distance_maxima: array of maximum values for each distance for normalization purposes
         distance_weights: weight given to each component of the distance function. Should add to 1.
@@ -212,20 +374,29 @@ def track_storms(storm_objects, times, distance_components, distance_maxima, dis
     obj_matcher = ObjectMatcher(distance_components, distance_weights, distance_maxima)
     if tracked_objects is None:
         tracked_objects = []
+    # Indices of the tracks in tracked_objects keyed by the time of their next step
+    active_tracks = {}
+    for o, obj in enumerate(tracked_objects):
+        active_tracks.setdefault(obj.end_time + obj.step, []).append(o)
     for t, time in enumerate(times):
-        past_time_objects = []
-        for obj in tracked_objects:
-            if obj.end_time == time - obj.step:
-                past_time_objects.append(obj)
+        # Tracks not extended at this time can never be extended again, so they are removed from the index.
+        past_indices = sorted(active_tracks.pop(time, []))
+        past_time_objects = [tracked_objects[o] for o in past_indices]
+        new_objects = []
         if len(past_time_objects) == 0:
-            tracked_objects.extend(storm_objects[t])
+            new_objects = storm_objects[t]
         elif len(past_time_objects) > 0 and len(storm_objects[t]) > 0:
-            assignments = obj_matcher.match_objects(past_time_objects, storm_objects[t], times[t-1], times[t])
-            unpaired = list(range(len(storm_objects[t])))
+            # Tracks passed in with tracked_objects ended at the step before the first time.
+            previous_time = times[t-1] if t > 0 else time - past_time_objects[0].step
+            assignments = obj_matcher.match_objects(past_time_objects, storm_objects[t], previous_time, times[t])
+            unpaired = np.ones(len(storm_objects[t]), dtype=bool)
             for pair in assignments:
-                past_time_objects[pair[0]].extend(storm_objects[t][pair[1]])
-                unpaired.remove(pair[1])
-            if len(unpaired) > 0:
-                for up in unpaired:
-                    tracked_objects.append(storm_objects[t][up])
+                track = past_time_objects[pair[0]]
+                track.extend(storm_objects[t][pair[1]])
+                active_tracks.setdefault(track.end_time + track.step, []).append(past_indices[pair[0]])
+                unpaired[pair[1]] = False
+            new_objects = [storm_objects[t][up] for up in np.where(unpaired)[0]]
+        for obj in new_objects:
+            active_tracks.setdefault(obj.end_time + obj.step, []).append(len(tracked_objects))
+            tracked_objects.append(obj)
     return tracked_objects
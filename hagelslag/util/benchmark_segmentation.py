@@ -0,0 +1,266 @@
+import numpy as np
+import pandas as pd
+import argparse
+import tracemalloc
+import resource
+from time import perf_counter
+from datetime import datetime, timedelta
+from scipy.ndimage import gaussian_filter
+from hagelslag.data.ModelOutput import ModelOutput
+from hagelslag.processing.EnhancedWatershedSegmenter import EnhancedWatershed, rescale_data
+from hagelslag.processing.tracker import label_storm_objects
+
+# Domain shapes in (y, x) grid points. ssef matches the 3 km SSEF grid in the test data, conus_3km matches the HRRR
+# grid, and conus_1km is a 1 km grid over the SSEF domain.
+DOMAINS = {"small": (200, 300),
+           "ssef": (835, 1155),
+           "conus_3km": (1059, 1799),
+           "conus_1km": (2505, 3465)}
+
+# Fields are generated with a background, peak range, and fraction of the storm radius covered by the core.
+FIELDS = {"reflectivity": dict(background=5.0, peak=(45.0, 70.0), core=1.0),
+          "hail": dict(background=0.0, peak=(5.0, 75.0), core=0.4)}
+
+# label_storm_objects arguments for each method and field
+METHOD_PARAMS = {"reflectivity": {"ew": dict(min_intensity=20, max_intensity=60, min_area=4, max_area=100,
+                                             max_range=20, increment=1),
+                                  "ws": dict(min_intensity=20, max_intensity=60, min_area=4),
+                                  "hyst": dict(min_intensity=20, max_intensity=50, min_area=4)},
+                 "hail": {"ew": dict(min_intensity=5, max_intensity=50, min_area=4, max_area=50, max_range=10,
+                                     increment=1),
+                          "ws": dict(min_intensity=5, max_intensity=50, min_area=4),
+                          "hyst": dict(min_intensity=5, max_intensity=25, min_area=4)}}
+
+
+def main():
+    parser = argparse.ArgumentParser("Benchmark storm segmentation. By default the run time and labels of the "
+                                     "EnhancedWatershed engines are compared on model output. With --synthetic, "
+                                     "each segmentation method is timed on synthetic storm fields.")
+    parser.add_argument("-p", "--path", default="testdata/spring2015_unidata/", help="Path to model output")
+    parser.add_argument("-m", "--map", default="mapfiles/ssef2015.map", help="Model map file")
+    parser.add_argument("-n", "--ens", default="SSEF", help="Ensemble system name")
+    parser.add_argument("-e", "--member", default="wrf-s3cn_arw", help="Ensemble member")
+    parser.add_argument("-r", "--run", default="20150604", help="Run date in YYYYMMDD format")
+    parser.add_argument("-v", "--var", default="uh_max", help="Variable being segmented")
+    parser.add_argument("-s", "--start", type=int, default=18, help="Start forecast hour")
+    parser.add_argument("-f", "--end", type=int, default=24, help="End forecast hour")
+    parser.add_argument("-w", "--ew", default="0,1,100,100,20",
+                        help="Comma separated min_intensity, data_increment, max_intensity, size_threshold_pixels,"
+                             " and delta")
+    parser.add_argument("-x", "--scale", default="10,150", help="Comma separated min and max for rescaling the data")
+    parser.add_argument("-g", "--gauss", type=float, default=1, help="Gaussian filter standard deviation")
+    parser.add_argument("-y", "--synthetic", action="store_true", help="Benchmark methods on synthetic fields")
+    parser.add_argument("-d", "--domains", default="small,ssef", help="Comma separated domains: " +
+                                                                      ",".join(sorted(DOMAINS.keys())))
+    parser.add_argument("-t", "--fields", default="reflectivity,hail", help="Comma separated synthetic fields")
+    parser.add_argument("-a", "--methods", default="ew,ws,hyst", help="Comma separated segmentation methods")
+    parser.add_argument("-c", "--storms", default="50,200", help="Comma separated numbers of storms")
+    parser.add_argument("-z", "--radius", type=float, default=8, help="Mean storm radius in grid points")
+    parser.add_argument("-k", "--times", type=int, default=1, help="Number of time steps in each synthetic field")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes labeling time steps")
+    parser.add_argument("-b", "--tile", type=int, default=None,
+                        help="Tile size in grid points for hysteresis labeling of synthetic fields")
+    parser.add_argument("-i", "--seed", type=int, default=2015, help="Random seed for synthetic fields")
+    parser.add_argument("-o", "--out", default="segmentation_benchmark.csv",
+                        help="Output file for synthetic benchmark results. Written as json if the name ends in "
+                             ".json and as csv otherwise.")
+    args = parser.parse_args()
+    if args.synthetic:
+        results = benchmark_synthetic(args.domains.split(","), args.fields.split(","), args.methods.split(","),
+                                      [int(x) for x in args.storms.split(",")], storm_radius=args.radius,
+                                      num_times=args.times, seed=args.seed, num_workers=args.workers,
+                                      tile_size=args.tile)
+        print(results.to_string())
+        write_results(results, args.out)
+        return
+    run_date = datetime.strptime(args.run, "%Y%m%d")
+    model_grid = ModelOutput(args.ens, args.member, run_date, args.var,
+                             run_date + timedelta(hours=args.start), run_date + timedelta(hours=args.end),
+                             args.path, args.map, single_step=False)
+    model_grid.load_data()
+    ew_params = [int(x) for x in args.ew.split(",")]
+    scale = [float(x) for x in args.scale.split(",")]
+    grids = [gaussian_filter(rescale_data(model_grid.data[h], scale[0], scale[1]), args.gauss)
+             for h in range(model_grid.data.shape[0])]
+    results = compare_engines(grids, ew_params)
+    for h, result in enumerate(results):
+        print("Hour {0:02d} Legacy: {1:0.3f} s Array: {2:0.3f} s Speedup: {3:0.1f} Objects: {4:d} Match: {5}".format(
+            args.start + h, result["legacy"], result["array"], result["legacy"] / result["array"],
+            result["objects"], result["match"]))
+    total_legacy = np.sum([r["legacy"] for r in results])
+    total_array = np.sum([r["array"] for r in results])
+    print("Total Legacy: {0:0.3f} s Array: {1:0.3f} s Speedup: {2:0.1f}".format(total_legacy, total_array,
+                                                                              total_legacy / total_array))
+    return
+
+
+def compare_engines(grids, ew_params):
+    """
+    Label each grid with the legacy and array engines of EnhancedWatershed and time each one.
+
+    Args:
+        grids: list of 2D arrays to be labeled
+        ew_params: min_intensity, data_increment, max_intensity, size_threshold_pixels, and delta
+
+    Returns:
+        List of dictionaries containing the run time of each engine, the number of objects found, and whether the
+        labels are identical.
+    """
+    results = []
+    legacy_ew = EnhancedWatershed(*ew_params, engine="legacy")
+    array_ew = EnhancedWatershed(*ew_params, engine="array")
+    for grid in grids:
+        start = perf_counter()
+        legacy_labels = legacy_ew.label(grid)
+        legacy_time = perf_counter() - start
+        start = perf_counter()
+        array_labels = array_ew.label(grid)
+        array_time = perf_counter() - start
+        results.append(dict(legacy=legacy_time, array=array_time, objects=int(array_labels.max()),
+                            match=bool(np.array_equal(legacy_labels, array_labels))))
+    return results
+
+
+def synthetic_storm_field(shape, num_storms, storm_radius=8.0, field="reflectivity", num_times=1, seed=2015):
+    """
+    Generate a reproducible field of elliptical storms. Each storm has a Gaussian profile with a random center,
+    orientation, aspect ratio, radius, and peak intensity, and storms move a few grid points between time steps.
+
+    Args:
+        shape: (y, x) shape of the domain in grid points
+        num_storms: number of storms in the domain
+        storm_radius: mean storm radius in grid points
+        field: "reflectivity" for values in dBZ or "hail" for hail sizes in mm
+        num_times: number of time steps. If greater than 1, a 3D array in (time, y, x) order is returned.
+        seed: random seed
+
+    Returns:
+        2D or 3D array of synthetic storm values
+    """
+    field_params = FIELDS[field]
+    random_state = np.random.RandomState(seed)
+    centers = random_state.uniform(0, 1, size=(num_storms, 2)) * np.array(shape)
+    motion = random_state.normal(0, 2, size=(num_storms, 2))
+    radii = random_state.gamma(4, storm_radius / 4.0, size=num_storms) * field_params["core"]
+    aspects = random_state.uniform(1, 2.5, size=num_storms)
+    angles = random_state.uniform(0, np.pi, size=num_storms)
+    peaks = random_state.uniform(field_params["peak"][0], field_params["peak"][1], size=num_storms)
+    data = np.ones((num_times,) + tuple(shape), dtype=np.float32) * field_params["background"]
+    for t in range(num_times):
+        for s in range(num_storms):
+            y, x = centers[s] + t * motion[s]
+            extent = int(np.ceil(3 * radii[s] * aspects[s]))
+            rows = slice(max(int(y) - extent, 0), min(int(y) + extent + 1, shape[0]))
+            cols = slice(max(int(x) - extent, 0), min(int(x) + extent + 1, shape[1]))
+            if rows.start >= rows.stop or cols.start >= cols.stop:
+                continue
+            y_grid, x_grid = np.meshgrid(np.arange(rows.start, rows.stop) - y, np.arange(cols.start, cols.stop) - x,
+                                         indexing="ij")
+            along = (x_grid * np.cos(angles[s]) + y_grid * np.sin(angles[s])) / aspects[s]
+            across = -x_grid * np.sin(angles[s]) + y_grid * np.cos(angles[s])
+            profile = peaks[s] * np.exp(-0.5 * (along ** 2 + across ** 2) / radii[s] ** 2)
+            data[t, rows, cols] = np.maximum(data[t, rows, cols], profile)
+    if num_times == 1:
+        return data[0]
+    return data
+
+
+def benchmark_labeling(data, method, num_workers=1, tile_size=None, **label_args):
+    """
+    Time one call to label_storm_objects and measure its peak memory. The call is run twice so that memory tracing
+    does not slow down the timed run. Memory tracing only covers the calling process, so when the time steps are
+    labeled by worker processes, the peak resident memory of the workers is also recorded. The operating system only
+    reports the largest peak of all finished child processes, so the worker memory of a run includes the workers of
+    earlier runs in the same process.
+
+    Args:
+        data: 2D or 3D array being labeled
+        method: "ew", "ws", or "hyst"
+        num_workers: number of processes used to label time steps
+        tile_size: tile size passed to label_storm_objects
+        **label_args: other arguments to label_storm_objects
+
+    Returns:
+        dict containing the wall time in seconds, the peak memory allocated in MB by the calling process, the peak
+        resident memory in MB of a worker process or 0 if no workers were used, and the number of objects.
+    """
+    start = perf_counter()
+    labels = label_storm_objects(data, method, num_workers=num_workers, tile_size=tile_size, **label_args)
+    wall_time = perf_counter() - start
+    tracemalloc.start()
+    label_storm_objects(data, method, num_workers=num_workers, tile_size=tile_size, **label_args)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    worker_memory = 0
+    if num_workers > 1 and data.ndim == 3 and data.shape[0] > 1:
+        # ru_maxrss is in kB on Linux
+        worker_memory = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1e3
+    if labels.ndim == 2:
+        num_objects = int(labels.max())
+    else:
+        num_objects = int(np.sum([labels[t].max() for t in range(labels.shape[0])]))
+    return dict(wall_time=wall_time, peak_memory_mb=peak_memory / 1e6, worker_memory_mb=worker_memory / 1e6,
+                objects=num_objects)
+
+
+def benchmark_synthetic(domains, fields, methods, storm_counts, storm_radius=8.0, num_times=1, seed=2015,
+                        num_workers=1, tile_size=None):
+    """
+    Time each segmentation method through label_storm_objects on synthetic storm fields.
+
+    Args:
+        domains: list of domain names from DOMAINS or (y, x) shapes
+        fields: list of field names from FIELDS
+        methods: list of methods from METHOD_PARAMS
+        storm_counts: list of numbers of storms in each field
+        storm_radius: mean storm radius in grid points
+        num_times: number of time steps in each field
+        seed: random seed for the synthetic fields
+        num_workers: number of processes used to label time steps
+        tile_size: tile size passed to label_storm_objects for hysteresis. The other methods do not support tiling
+            and are run on the full domain.
+
+    Returns:
+        pandas DataFrame with one row for each domain, field, storm count, and method.
+    """
+    results = []
+    for domain in domains:
+        if isinstance(domain, str):
+            shape = DOMAINS[domain]
+        else:
+            shape = tuple(domain)
+            domain = "{0:d}x{1:d}".format(*shape)
+        for field in fields:
+            for num_storms in storm_counts:
+                data = synthetic_storm_field(shape, num_storms, storm_radius=storm_radius, field=field,
+                                             num_times=num_times, seed=seed)
+                for method in methods:
+                    method_tile_size = tile_size if method == "hyst" else None
+                    result = benchmark_labeling(data, method, num_workers=num_workers, tile_size=method_tile_size,
+                                                **METHOD_PARAMS[field][method])
+                    result.update(dict(domain=domain, ny=shape[0], nx=shape[1], times=num_times, field=field,
+                                       storms=num_storms, radius=storm_radius, method=method,
+                                       workers=num_workers, tile_size=method_tile_size))
+                    results.append(result)
+    columns = ["domain", "ny", "nx", "times", "field", "storms", "radius", "method", "workers", "tile_size",
+               "wall_time", "peak_memory_mb", "worker_memory_mb", "objects"]
+    return pd.DataFrame(results, columns=columns)
+
+
+def write_results(results, out_file):
+    """
+    Write benchmark results to a json file of records if out_file ends in .json and to a csv file otherwise.
+
+    Args:
+        results: pandas DataFrame of benchmark results
+        out_file: output file name
+    """
+    if out_file.endswith(".json"):
+        results.to_json(out_file, orient="records", indent=2)
+    else:
+        results.to_csv(out_file, index=False)
+    return
+
+
+if __name__ == "__main__":
+    main()
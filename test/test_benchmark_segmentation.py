@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+import pandas as pd
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+from hagelslag.util.benchmark_segmentation import synthetic_storm_field, write_results
+
+
+class TestBenchmarkSegmentation(unittest.TestCase):
+    def setUp(self):
+        self.out_path = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.out_path)
+
+    def test_synthetic_storm_field(self):
+        for field in ["reflectivity", "hail"]:
+            data = synthetic_storm_field((40, 60), 10, field=field, seed=4)
+            self.assertEqual(data.shape, (40, 60), "Wrong 2D shape")
+            self.assertTrue(np.array_equal(data, synthetic_storm_field((40, 60), 10, field=field, seed=4)),
+                            "Same seed gives a different field")
+            self.assertFalse(np.array_equal(data, synthetic_storm_field((40, 60), 10, field=field, seed=5)),
+                             "Different seeds give the same field")
+            self.assertGreater(data.max(), data.min(), "No storms in field")
+        data = synthetic_storm_field((40, 60), 10, num_times=3, seed=4)
+        self.assertEqual(data.shape, (3, 40, 60), "Wrong 3D shape")
+        self.assertTrue(np.array_equal(data, synthetic_storm_field((40, 60), 10, num_times=3, seed=4)),
+                        "Same seed gives a different 3D field")
+
+    def test_write_results(self):
+        results = pd.DataFrame({"method": ["ew", "hyst"], "wall_time": [0.5, 0.25], "objects": [10, 12]})
+        csv_file = join(self.out_path, "results.csv")
+        write_results(results, csv_file)
+        self.assertTrue(pd.read_csv(csv_file).equals(results), "csv results do not match")
+        json_file = join(self.out_path, "results.json")
+        write_results(results, json_file)
+        self.assertTrue(pd.read_json(json_file, orient="records").equals(results), "json results do not match")
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+import json
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+from pyproj import Proj
+from hagelslag.processing.STObject import STObject, read_geojson
+from hagelslag.processing.GeoJSONTrack import GeoJSONTrack, JSONScanner
+
+
+class TestGeoJSONTrack(unittest.TestCase):
+    def setUp(self):
+        self.out_path = mkdtemp()
+        self.proj = Proj(proj="lcc", lat_1=30, lat_2=60, lat_0=38, lon_0=-97)
+        random_state = np.random.RandomState(8)
+        grids = random_state.gamma(1, 20, size=(3, 15, 12))
+        rows, cols = np.indices((15, 12))
+        self.track = STObject(grids, (grids > 10).astype(int), np.stack([cols * 3000.0] * 3),
+                              np.stack([rows * 3000.0] * 3), np.stack([rows] * 3), np.stack([cols] * 3), 4, 6,
+                              dx=3000, u=random_state.normal(size=3), v=random_state.normal(size=3))
+        self.track.attributes["uh"] = [grid * 2 for grid in grids]
+        self.track.attributes["cape"] = [(grid * 100).astype(int) for grid in grids]
+        self.metadata = {"id": 'track "a" [1]', "duration": 3}
+
+    def tearDown(self):
+        rmtree(self.out_path)
+
+    def test_scanner(self):
+        value = {"a": [[1, 2], [3, [4, 5]]], "b": 'text with "quotes", [brackets] and \\\\', "c": {"d": [], "e": 1.5},
+                 "f": True}
+        for indent in [None, 1]:
+            text = json.dumps(value, indent=indent).encode()
+            spans = JSONScanner(text).scan_object(0)
+            self.assertEqual(list(spans.keys()), list(value.keys()), "Wrong keys")
+            for key, span in spans.items():
+                self.assertEqual(json.loads(text[slice(*span)]), value[key], "Wrong value of " + key)
+
+    def test_read(self):
+        for stream in [False, True]:
+            filename = join(self.out_path, "track_{0}.json".format(stream))
+            self.track.to_geojson(filename, self.proj, self.metadata, stream=stream)
+            full_track = read_geojson(filename)
+            lazy_track = GeoJSONTrack(filename)
+            self.assertEqual(len(lazy_track), 3, "Wrong number of features")
+            self.assertEqual(lazy_track.properties["id"], self.metadata["id"], "Metadata does not match")
+            self.assertTrue(np.array_equal(lazy_track.times, self.track.times), "Times do not match")
+            self.assertEqual(lazy_track.attribute_names(), ["cape", "uh"], "Attribute names do not match")
+            for mask, lazy_mask in zip(full_track.masks, lazy_track.step_arrays("masks")):
+                self.assertTrue(np.array_equal(mask, lazy_mask), "Masks do not match")
+            read_track = lazy_track.to_stobject()
+            self.assertTrue(np.array_equal(read_track.u, full_track.u), "Motion does not match")
+            for attr in ["timesteps", "masks", "x", "y", "i", "j"]:
+                for step, read_step in zip(getattr(full_track, attr), getattr(read_track, attr)):
+                    self.assertTrue(np.array_equal(step, read_step), attr + " does not match")
+            for attribute, steps in full_track.attributes.items():
+                for step, read_step in zip(steps, read_track.attributes[attribute]):
+                    self.assertTrue(np.array_equal(step, read_step), attribute + " does not match")
+            self.assertEqual(lazy_track.geometry(1)["type"], "Polygon", "Wrong geometry")
@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+from os.path import join, exists
+from tempfile import mkdtemp
+from shutil import rmtree
+from hagelslag.processing.tracker import label_storm_objects, extract_storm_objects, track_storms
+from hagelslag.processing.IncrementalTracker import IncrementalTracker
+from hagelslag.processing.TrackFile import TrackFile
+from hagelslag.processing.ObjectMatcher import shifted_centroid_distance, time_distance
+
+
+class TestIncrementalTracker(unittest.TestCase):
+    def setUp(self):
+        self.dx = 3000
+        rows, cols = np.indices((60, 80))
+        self.x = cols * float(self.dx)
+        self.y = rows * float(self.dx)
+        self.times = np.arange(6)
+        self.data = np.zeros((self.times.size, 60, 80))
+        # Storms moving in different directions, starting and ending at different times
+        for t in self.times:
+            for row, col, d_row, d_col, start, end in [(10, 10, 1, 2, 0, 5), (45, 60, -1, -1, 1, 4),
+                                                       (30, 30, 0, 2, 3, 5), (50, 10, 1, 0, 0, 1)]:
+                if start <= t <= end:
+                    self.data[t] += 40 * np.exp(-0.5 * ((rows - row - d_row * t) ** 2 +
+                                                        (cols - col - d_col * t) ** 2) / 4.0)
+        self.tracker_args = ("hyst", 10, 30, self.x, self.y, [shifted_centroid_distance, time_distance],
+                             np.array([20000, 1]), np.array([0.8, 0.2]))
+
+    def test_incremental_tracking(self):
+        label_grid = label_storm_objects(self.data, "hyst", 10, 30, min_area=2)
+        storm_objects = extract_storm_objects(label_grid, self.data, self.x, self.y, self.times, dx=self.dx)
+        tracks = track_storms(storm_objects, self.times, *self.tracker_args[5:])
+        out_path = mkdtemp()
+        try:
+            checkpoint_file = join(out_path, "tracker.nc")
+            tracker = IncrementalTracker(*self.tracker_args, dx=self.dx, label_kwargs={"min_area": 2},
+                                         checkpoint_file=checkpoint_file)
+            for t in self.times:
+                if t == 3:
+                    # Resume from the checkpoint as if the process restarted
+                    tracker = IncrementalTracker(*self.tracker_args, dx=self.dx, label_kwargs={"min_area": 2},
+                                                 checkpoint_file=checkpoint_file)
+                    self.assertEqual(tracker.last_time, 2, "Wrong last time in checkpoint")
+                tracker.add_time(self.data[t], t)
+            with self.assertRaises(ValueError):
+                tracker.add_time(self.data[0], 0)
+            # Only active tracks are rewritten in the checkpoint; each finished track is written once
+            with TrackFile(checkpoint_file) as track_file:
+                self.assertEqual(len(track_file), len(tracker.active_tracks), "Finished tracks in checkpoint")
+            num_finished = 0
+            for time in tracker.finished_times:
+                with TrackFile(tracker.finished_file(time)) as track_file:
+                    num_finished += len(track_file)
+            self.assertEqual(num_finished, len(tracker.finished_tracks()), "Wrong number of finished tracks")
+            self.assertFalse(exists(tracker.finished_file(self.times[0])), "Finished track file without tracks")
+        finally:
+            rmtree(out_path)
+        self.assertEqual(len(tracker.tracked_objects), len(tracks), "Wrong number of tracks")
+        self.assertEqual(len(tracks), 4, "Storms not tracked")
+        for track, incremental_track in zip(tracks, tracker.tracked_objects):
+            self.assertTrue(np.array_equal(track.times, incremental_track.times), "Times do not match")
+            self.assertTrue(np.allclose(track.u, incremental_track.u), "Motion does not match")
+            for attr in ["timesteps", "masks", "i", "j"]:
+                for step, incremental_step in zip(getattr(track, attr), getattr(incremental_track, attr)):
+                    self.assertTrue(np.array_equal(step, incremental_step), attr + " does not match")
+        self.assertEqual([list(track.times) for track in tracker.active_tracks],
+                         [list(track.times) for track in tracks if track.end_time == self.times[-1]],
+                         "Wrong active tracks")
+        self.assertEqual(len(tracker.finished_tracks()) + len(tracker.active_tracks), len(tracks),
+                         "Finished and active tracks do not add up")
@@ -0,0 +1,121 @@
+import unittest
+import numpy as np
+from hagelslag.processing.STObject import STObject
+from hagelslag.processing.ObjectMatcher import ObjectMatcher, TrackMatcher, TrackStepMatcher, centroid_distance, \
+    shifted_centroid_distance, time_distance, max_intensity, area_difference, nonoverlap, start_centroid_distance, \
+    start_time_distance, duration_distance, mean_area_distance, mean_min_time_distance, optimal_assignment, \
+    connected_blocks, block_assignment
+
+
+class TestObjectMatcher(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(4)
+        self.objects = {}
+        for start_time in [1, 2]:
+            self.objects[start_time] = []
+            for o in range(12):
+                num_steps = random_state.randint(1, 4) if start_time == 1 else 1
+                grids = random_state.gamma(1, 20, size=(num_steps, 8, 9))
+                corner = random_state.randint(0, 40, size=2)
+                rows, cols = np.indices((8, 9))
+                rows = np.stack([rows + corner[0]] * num_steps)
+                cols = np.stack([cols + corner[1]] * num_steps)
+                self.objects[start_time].append(STObject(grids, (grids > 15).astype(int), cols * 3000.0,
+                                                         rows * 3000.0, rows, cols, start_time,
+                                                         start_time + num_steps - 1,
+                                                         u=random_state.normal(size=num_steps) * 3000,
+                                                         v=random_state.normal(size=num_steps) * 3000))
+
+    def test_cost_matrix(self):
+        components = [centroid_distance, shifted_centroid_distance, time_distance, max_intensity, area_difference,
+                      nonoverlap]
+        matcher = ObjectMatcher(components, np.array([0.3, 0.2, 0.1, 0.1, 0.2, 0.1]),
+                                np.array([60000, 50000, 2, 40, 30, 1]))
+        set_a = [track for track in self.objects[1] if track.times.size == 1]
+        costs = matcher.cost_matrix(set_a, self.objects[2], 1, 2)
+        self.assertEqual(costs.shape, (len(set_a), len(self.objects[2])), "Wrong cost matrix shape")
+        for a, item_a in enumerate(set_a):
+            for b, item_b in enumerate(self.objects[2]):
+                self.assertAlmostEqual(costs[a, b], matcher.total_cost_function(item_a, item_b, 1, 2),
+                                       msg="Costs do not match")
+
+    def test_track_cost_matrix(self):
+        components = [start_centroid_distance, start_time_distance, duration_distance, mean_area_distance,
+                      mean_min_time_distance]
+        matcher = TrackMatcher(components, np.ones(5), np.array([80000, 2, 3, 50, 2]))
+        costs = matcher.track_cost_matrix(self.objects[1], self.objects[2])
+        self.assertLess(costs.min(), 1, "No tracks are close enough to match")
+        for a, item_a in enumerate(self.objects[1]):
+            for b, item_b in enumerate(self.objects[2]):
+                self.assertAlmostEqual(costs[a, b], matcher.track_cost_function(item_a, item_b),
+                                       msg="Costs do not match")
+        step_matcher = TrackStepMatcher([centroid_distance, time_distance], np.array([80000, 2]))
+        step_costs = step_matcher.cost_matrix(self.objects[1], self.objects[2])
+        s = 0
+        for item_a in self.objects[1]:
+            for time_a in item_a.times:
+                for b, item_b in enumerate(self.objects[2]):
+                    self.assertTrue(np.allclose(step_costs[s, b], step_matcher.cost(item_a, time_a, item_b, 2)),
+                                    "Step costs do not match")
+                s += 1
+
+    def test_assignment_solvers(self):
+        random_state = np.random.RandomState(7)
+        for shape in [(6, 6), (4, 9), (9, 4), (1, 5)]:
+            costs = random_state.uniform(size=shape)
+            munkres_matches = optimal_assignment(costs, "munkres")
+            scipy_matches = optimal_assignment(costs, "scipy")
+            self.assertEqual(len(scipy_matches), min(shape), "Wrong number of assignments")
+            self.assertEqual(scipy_matches, munkres_matches, "Assignments do not match")
+            self.assertAlmostEqual(sum([costs[a, b] for a, b in scipy_matches]),
+                                   sum([costs[a, b] for a, b in munkres_matches]), msg="Total costs do not match")
+        with self.assertRaises(ValueError):
+            optimal_assignment(costs, "other")
+        components = [centroid_distance, time_distance]
+        for solver in ["munkres", "scipy"]:
+            matcher = ObjectMatcher(components, np.array([0.7, 0.3]), np.array([150000, 2]), solver=solver)
+            track_matcher = TrackMatcher([start_centroid_distance], np.ones(1), np.array([150000]), solver=solver)
+            matches = matcher.match_objects(self.objects[1], self.objects[2], 1, 2)
+            track_matches = track_matcher.match_tracks(self.objects[1], self.objects[2])
+            if solver == "munkres":
+                munkres_matches, munkres_track_matches = matches, track_matches
+        self.assertGreater(len(matches), 0, "No objects matched")
+        self.assertEqual(matches, munkres_matches, "Object matches do not match")
+        self.assertEqual(track_matches, munkres_track_matches, "Track matches do not match")
+        costs = matcher.cost_matrix(self.objects[1], self.objects[2], 1, 2)
+        self.assertTrue(all([costs[a, b] < 1 for a, b in matches]), "Match exceeds maximum cost")
+
+    def test_gated_matching(self):
+        costs = np.array([[0.5, 1.0, 1.0, 1.0],
+                          [0.2, 0.4, 1.0, 1.0],
+                          [1.0, 1.0, 1.0, 0.3],
+                          [1.0, 1.0, 1.0, 1.0]]) * 100
+        blocks = connected_blocks(*np.nonzero(costs < 100), 4, 4)
+        self.assertEqual([(list(rows), list(cols)) for rows, cols, pairs in blocks], [([0, 1], [0, 1]), ([2], [3])],
+                         "Wrong blocks")
+        self.assertEqual(block_assignment(costs), [(0, 0), (1, 1), (2, 3)], "Wrong block assignment")
+        components = [centroid_distance, time_distance]
+        matcher = ObjectMatcher(components, np.array([0.8, 0.2]), np.array([60000, 2]))
+        gated_matcher = ObjectMatcher(components, np.array([0.8, 0.2]), np.array([60000, 2]), gate_distance=60000)
+        costs = matcher.cost_matrix(self.objects[1], self.objects[2], 1, 2)
+        gated_costs = costs.copy()
+        for a, item_a in enumerate(self.objects[1]):
+            for b, item_b in enumerate(self.objects[2]):
+                if centroid_distance(item_a, 1, item_b, 2, 60000) == 1:
+                    gated_costs[a, b] = 1
+        for matcher_costs, object_matcher in [(costs, matcher), (gated_costs, gated_matcher)]:
+            rows, cols = [np.unique(index) for index in np.nonzero(matcher_costs < 1)]
+            dense_matches = [(rows[a], cols[b]) for a, b in optimal_assignment(matcher_costs[np.ix_(rows, cols)])
+                             if matcher_costs[rows[a], cols[b]] < 1]
+            matches = object_matcher.match_objects(self.objects[1], self.objects[2], 1, 2)
+            self.assertGreater(len(matches), 1, "Too few objects matched")
+            self.assertEqual(matches, dense_matches, "Block matches do not match")
+        track_matcher = TrackMatcher([start_centroid_distance, start_time_distance], np.ones(2), np.array([60000, 2]))
+        self.assertEqual(track_matcher.gate_distance, 60000, "Gate distance not set")
+        for closest_matches in [False, True]:
+            track_matches = track_matcher.match_tracks(self.objects[1], self.objects[2], closest_matches)
+            track_matcher.gate_distance = None
+            self.assertEqual(track_matches, track_matcher.match_tracks(self.objects[1], self.objects[2],
+                                                                       closest_matches),
+                             "Gated track matches do not match")
+            track_matcher.gate_distance = 60000
@@ -0,0 +1,96 @@
+import unittest
+import numpy as np
+from collections import OrderedDict
+from scipy.ndimage import gaussian_filter
+from hagelslag.processing.EnhancedWatershedSegmenter import EnhancedWatershed, CenterIndex, sweep_labels
+from hagelslag.processing.Hysteresis import Hysteresis
+from hagelslag.processing.size_filter import size_filter
+
+
+class TestSegmentation(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(12)
+        self.grids = []
+        for s in range(3):
+            grid = gaussian_filter(random_state.gamma(1.0, 30, size=(60, 70)), 2)
+            self.grids.append(grid / grid.max() * 100)
+        self.ew_params = (10, 1, 80, 30, 15)
+
+    def test_ew_engines(self):
+        legacy_ew = EnhancedWatershed(*self.ew_params, engine="legacy")
+        array_ew = EnhancedWatershed(*self.ew_params)
+        for grid in self.grids:
+            legacy_labels = legacy_ew.label(grid, only_objects=False)
+            array_labels = array_ew.label(grid, only_objects=False)
+            self.assertGreater(array_labels.max(), 0, "No objects found")
+            self.assertTrue(np.array_equal(legacy_labels, array_labels), "Engine labels do not match")
+
+    def test_ew_sparse(self):
+        ew = EnhancedWatershed(*self.ew_params)
+        sparse_ew = EnhancedWatershed(*self.ew_params, sparse=True)
+        for grid in self.grids:
+            sparse_grid = np.where(grid > 60, grid, 0)
+            labels = ew.label(sparse_grid, only_objects=False)
+            sparse_labels = sparse_ew.label(sparse_grid, only_objects=False)
+            self.assertTrue(np.array_equal(np.minimum(labels, 0), np.minimum(sparse_labels, 0)),
+                            "Sparse background does not match")
+            label_pairs = np.unique(np.vstack([labels[labels > 0], sparse_labels[labels > 0]]), axis=1)
+            self.assertEqual(label_pairs.shape[1], np.unique(labels[labels > 0]).size, "Sparse objects do not match")
+            self.assertEqual(label_pairs.shape[1], np.unique(sparse_labels[sparse_labels > 0]).size,
+                             "Sparse objects do not match")
+
+    def test_ew_sweep(self):
+        param_sets = [(10, inc, 80, size, delta) for inc in [1, 2] for size in [20, 30] for delta in [5, 15]]
+        param_sets.append(dict(min_intensity=10, data_increment=1, max_intensity=80, size_threshold_pixels=30,
+                               delta=10))
+        for grid in self.grids:
+            sweep = sweep_labels(grid, param_sets, only_objects=False)
+            self.assertEqual(len(sweep), len(param_sets), "Sweep returned wrong number of grids")
+            for params, sweep_grid in zip(param_sets, sweep):
+                if isinstance(params, dict):
+                    labels = EnhancedWatershed(**params).label(grid, only_objects=False)
+                else:
+                    labels = EnhancedWatershed(*params).label(grid, only_objects=False)
+                self.assertTrue(np.array_equal(labels, sweep_grid), "Sweep labels do not match")
+
+    def test_center_index(self):
+        random_state = np.random.RandomState(5)
+        centers = OrderedDict()
+        for b in range(11):
+            centers[b] = [tuple(c) for c in random_state.randint(0, 20, size=(random_state.randint(0, 4), 2))]
+        center_coords = OrderedDict([(b, np.array(c, dtype=int).reshape(-1, 2)) for b, c in centers.items()])
+        center_index = CenterIndex(center_coords)
+        points = np.array([(i, j) for i in range(20) for j in range(20)])
+        for bin_num in range(10, -1, -1):
+            for center in [(0, 0), (10, 10), (5, 17)]:
+                expected = [EnhancedWatershed.is_closest(tuple(p), center, centers, bin_num) for p in points]
+                self.assertTrue(np.array_equal(center_index.is_closest(points, np.array(center), bin_num), expected),
+                                "Center index does not match is_closest")
+
+    def test_hysteresis(self):
+        grid = np.array([[0, 0, 0, 0, 0, 0, 0],
+                         [0, 60, 20, 0, 0, 0, 0],
+                         [0, 20, 0, 20, 70, 0, 0],
+                         [0, 0, 0, 0, 0, 0, 0],
+                         [0, 0, 20, 0, 0, 30, 0],
+                         [0, 0, 20, 0, 0, 30, 0]])
+        labels = Hysteresis(10, 50).label(grid)
+        expected = np.zeros(grid.shape, dtype=int)
+        expected[1:3, 1:5][grid[1:3, 1:5] > 10] = 2
+        self.assertTrue(np.array_equal(labels, expected), "Hysteresis labels are incorrect")
+        self.assertEqual(Hysteresis.size_filter(labels, 5).max(), 1, "Size filter did not keep object")
+        self.assertEqual(Hysteresis.size_filter(labels, 6).max(), 0, "Size filter did not remove object")
+
+    def test_size_filter(self):
+        labels = np.array([[1, 1, 0, 0, 3],
+                           [1, 1, 0, 0, 3],
+                           [0, 0, 0, 0, 3],
+                           [4, 4, 0, 5, 5],
+                           [4, 4, 0, 5, 0]])
+        expected = np.array([[1, 1, 0, 0, 0],
+                             [1, 1, 0, 0, 0],
+                             [0, 0, 0, 0, 0],
+                             [2, 2, 0, 3, 3],
+                             [2, 2, 0, 3, 0]])
+        self.assertTrue(np.array_equal(size_filter(labels, 3), expected), "Size filter output is incorrect")
+        self.assertEqual(size_filter(labels, 4).max(), 2, "Size filter kept small objects")
@@ -0,0 +1,178 @@
+import unittest
+import numpy as np
+import json
+import pickle
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+from pyproj import Proj
+from skimage.morphology import convex_hull_image
+from skimage.segmentation import find_boundaries
+from hagelslag.processing.STObject import STObject, read_geojson, tracks_to_geojson, read_geojson_tracks
+
+
+class TestSTObject(unittest.TestCase):
+    def setUp(self):
+        self.dx = 3000
+        self.shape = (60, 80)
+        rows, cols = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing="ij")
+        self.grid = 50 * np.exp(-0.5 * ((rows - 30) ** 2 / 16.0 + (cols - 40) ** 2 / 36.0))
+        self.grid[28:31, 35:37] += 10
+        self.rows = rows
+        self.cols = cols
+
+    def make_object(self, grid, corner=(20, 28), size=(21, 25), time=1):
+        box = (slice(corner[0], corner[0] + size[0]), slice(corner[1], corner[1] + size[1]))
+        mask = (grid[box] > 5).astype(int)
+        return STObject(grid[box], mask, self.cols[box] * self.dx, self.rows[box] * self.dx, self.rows[box],
+                        self.cols[box], time, time, dx=self.dx)
+
+    def test_estimate_motion(self):
+        for du, dv in [(0, 0), (3, -2), (-5, 4)]:
+            previous_grid = np.roll(self.grid, (-dv, -du), axis=(0, 1))
+            storm = self.make_object(self.grid)
+            u, v, error = storm.estimate_motion(1, previous_grid, 8, 8)
+            self.assertEqual((u, v), (du * self.dx, dv * self.dx), "Wrong motion estimate")
+            self.assertEqual(error, 0, "Error of exact shift is not zero")
+            self.assertEqual((storm.u[0], storm.v[0]), (u, v), "Motion was not stored")
+        # When every shift has the same error, the first shift searched is kept.
+        storm = self.make_object(self.grid)
+        u, v, error = storm.estimate_motion(1, np.zeros((5, 5)), 2, 3)
+        self.assertEqual((u, v), (-2 * self.dx, -3 * self.dx), "Ties not broken in search order")
+
+    def test_compress(self):
+        storm = self.make_object(self.grid, time=1)
+        storm.extend(self.make_object(self.grid, corner=(22, 30), size=(18, 20), time=2))
+        compact = self.make_object(self.grid, time=1)
+        compact.compress(self.cols * self.dx, self.rows * self.dx)
+        compact.extend(self.make_object(self.grid, corner=(22, 30), size=(18, 20), time=2))
+        self.assertEqual(len(compact.corners), 2, "Corners not extended")
+        self.assertEqual(compact.corners[1], (22, 30), "Wrong corner")
+        for attr in ["masks", "x", "y", "i", "j"]:
+            self.assertEqual(len(getattr(compact, attr)), 2, "Wrong number of steps in " + attr)
+            for step, compact_step in zip(getattr(storm, attr), getattr(compact, attr)):
+                self.assertTrue(np.array_equal(step, compact_step), attr + " does not match")
+        self.assertTrue(np.array_equal(storm.trajectory(), compact.trajectory()), "Trajectories do not match")
+        self.assertTrue(np.array_equal(storm.masks[-1], compact.masks[-1]), "Negative step index does not match")
+        self.assertFalse(compact.x[0].flags.writeable, "Coordinate view of the shared grid is writable")
+
+    def test_cached_properties(self):
+        storm = self.make_object(self.grid, time=1)
+        com = storm.center_of_mass(1)
+        size = storm.size(1)
+        shape_stats = storm.calc_shape_step(["area", "eccentricity"], 1)
+        self.assertEqual(storm.max_size(), size, "Wrong maximum size")
+        self.assertEqual(storm.center_of_mass(1), com, "Cached center of mass changed")
+        self.assertEqual(storm.calc_shape_step(["area", "eccentricity"], 1), shape_stats, "Cached shape changed")
+        storm.extend(self.make_object(self.grid * 2, corner=(22, 30), size=(30, 40), time=2))
+        self.assertEqual(storm.trajectory().shape, (2, 2), "Trajectory not updated by extend")
+        self.assertGreater(storm.max_size(), size, "Maximum size not updated by extend")
+        self.assertEqual(storm.size(2), storm.masks[1].sum(), "Wrong size after extend")
+        self.assertEqual(storm.calc_shape_step(["area"], 2)[0], storm.masks[1].sum(), "Wrong shape after extend")
+        storm.closest_distance(1, self.make_object(self.grid, time=1), 1)
+        self.assertGreater(len(storm.cache), 0, "Nothing cached")
+        unpickled = pickle.loads(pickle.dumps(storm))
+        self.assertEqual(unpickled.cache, {}, "Cache was pickled")
+        self.assertGreater(len(storm.cache), 0, "Pickling cleared the cache of the original object")
+        self.assertEqual(unpickled.center_of_mass(2), storm.center_of_mass(2), "Unpickled object does not match")
+        storm.compress(self.cols * self.dx, self.rows * self.dx)
+        self.assertEqual(storm.cache, {}, "Cache not cleared by compress")
+
+    def test_distances(self):
+        grid = np.where(self.rows + self.cols > 2, 10, 0)
+        storm = self.make_object(grid, corner=(0, 0), size=(28, 38))
+        other = self.make_object(grid, corner=(30, 40), size=(30, 40))
+        points = np.stack([storm.x[0][storm.masks[0] == 1], storm.y[0][storm.masks[0] == 1]], axis=-1)
+        o_points = np.stack([other.x[0][other.masks[0] == 1], other.y[0][other.masks[0] == 1]], axis=-1)
+        distances = (points[:, 0:1] - o_points[:, 0]) ** 2 + (points[:, 1:2] - o_points[:, 1]) ** 2
+        self.assertGreater(distances.size, 1000000, "Objects too small to use the KD-tree")
+        self.assertEqual(storm.closest_distance(1, other, 1), np.sqrt(distances.min()), "Wrong closest distance")
+        for percentile in [0, 10, 50, 72.5, 100]:
+            self.assertEqual(storm.percentile_distance(1, other, 1, percentile),
+                             np.sqrt(np.percentile(distances, percentile)), "Wrong percentile distance")
+
+    def test_count_overlap(self):
+        grid = np.where((self.rows + self.cols) % 3 > 0, 10, 0)
+        storm = self.make_object(grid, corner=(10, 10), size=(20, 30))
+        other = self.make_object(grid, corner=(20, 25), size=(30, 30))
+        overlap = np.count_nonzero(grid[20:30, 25:40] > 5)
+        self.assertEqual(storm.count_overlap(1, other, 1),
+                         overlap / float(max(storm.masks[0].sum(), other.masks[0].sum())), "Wrong overlap")
+        apart = self.make_object(grid, corner=(40, 50), size=(10, 10))
+        self.assertEqual(storm.count_overlap(1, apart, 1), 0, "Separate objects overlap")
+
+    def test_multiple_steps(self):
+        box = (slice(20, 40), slice(30, 50))
+        grids = np.stack([self.grid[box]] * 3)
+        storm = STObject(grids, (grids > 5).astype(int), np.stack([self.cols[box] * self.dx] * 3),
+                         np.stack([self.rows[box] * self.dx] * 3), np.stack([self.rows[box]] * 3),
+                         np.stack([self.cols[box]] * 3), 1, 3, dx=self.dx)
+        self.assertEqual(len(storm.masks), 3, "Wrong number of masks")
+        self.assertEqual(storm.max_size(), np.count_nonzero(grids[0] > 5), "Wrong maximum size")
+
+    def test_attribute_statistic_array(self):
+        storm = self.make_object(self.grid, time=1)
+        storm.extend(self.make_object(self.grid * 2, corner=(22, 30), size=(18, 20), time=2))
+        storm.extend(self.make_object(self.grid, corner=(50, 70), size=(10, 10), time=3))
+        storm.attributes["a"] = [storm.timesteps[t].astype(np.float32) for t in range(3)]
+        storm.attributes["b"] = [(storm.timesteps[t] * 10).astype(int) for t in range(3)]
+        statistics = ["mean", "max", "std", "median", "skew", "percentile_90", "mean_dt", "percentile_10_dt",
+                      "max_dt_dt", "other"]
+        stat_array = storm.calc_attribute_statistic_array(["a", "b"], statistics)
+        self.assertEqual(stat_array.shape, (3, 2 * len(statistics)), "Wrong statistic array shape")
+        expected = np.array([[storm.calc_attribute_statistic(attribute, statistic, time)
+                              for attribute in ["a", "b"] for statistic in statistics] for time in storm.times],
+                            dtype=float)
+        self.assertTrue(np.all(np.isnan(stat_array[2])), "Statistics of empty step are not missing")
+        self.assertTrue(np.array_equal(stat_array, expected, equal_nan=True), "Statistics do not match")
+        storm.attributes["c"] = [np.ma.masked_greater(storm.timesteps[t], 20) for t in range(3)]
+        self.assertTrue(np.ma.is_masked(storm.attributes["c"][0][storm.masks[0] == 1]), "No masked values in object")
+        stat_array = storm.calc_attribute_statistic_array(["a", "c", "b"], statistics)
+        expected = np.array([[storm.calc_attribute_statistic(attribute, statistic, time)
+                              for attribute in ["a", "c", "b"] for statistic in statistics] for time in storm.times],
+                            dtype=float)
+        self.assertTrue(np.array_equal(stat_array, expected, equal_nan=True), "Masked statistics do not match")
+
+    def test_geojson(self):
+        out_path = mkdtemp()
+        proj = Proj(proj="lcc", lat_1=30, lat_2=60, lat_0=38, lon_0=-97)
+        storm = self.make_object(self.grid, time=1)
+        storm.extend(self.make_object(self.grid, corner=(22, 30), size=(18, 20), time=2))
+        storm.attributes["a"] = [storm.timesteps[t] * 2 for t in range(2)]
+        other = self.make_object(self.grid * 2, time=4)
+        other.attributes["a"] = [other.timesteps[0] * 2]
+        try:
+            storm.to_geojson(join(out_path, "storm.json"), proj, {"id": "storm"})
+            storm.to_geojson(join(out_path, "storm_stream.json"), proj, {"id": "storm"}, stream=True)
+            with open(join(out_path, "storm.json")) as json_file, \
+                    open(join(out_path, "storm_stream.json")) as stream_file:
+                self.assertEqual(json.load(json_file), json.load(stream_file), "Streamed geoJSON does not match")
+            tracks_to_geojson([storm, other], join(out_path, "tracks.json"), proj, [{"id": "storm"}, {"id": "other"}])
+            tracks = read_geojson_tracks(join(out_path, "tracks.json"))
+            self.assertEqual(len(tracks), 2, "Wrong number of tracks")
+            for track, read_track in zip([read_geojson(join(out_path, "storm.json")), other], tracks):
+                self.assertTrue(np.array_equal(track.times, read_track.times), "Times do not match")
+                for attr in ["timesteps", "masks", "x", "y", "i", "j"]:
+                    for step, read_step in zip(getattr(track, attr), getattr(read_track, attr)):
+                        self.assertTrue(np.array_equal(step, read_step), attr + " does not match")
+                for step, read_step in zip(track.attributes["a"], read_track.attributes["a"]):
+                    self.assertTrue(np.array_equal(step, read_step), "Attributes do not match")
+        finally:
+            rmtree(out_path)
+
+    def test_boundary_polygon(self):
+        grid = np.where((self.rows - 30) ** 2 + (self.cols - 40) ** 2 < 64, 10, 0)
+        grid[30, 40:50] = 10
+        for corner, size in [((20, 28), (21, 25)), ((22, 32), (16, 16))]:
+            storm = self.make_object(grid, corner=corner, size=size)
+            chull = convex_hull_image(np.pad(storm.masks[0], 1, "constant", constant_values=0))
+            boundary_image = find_boundaries(chull, mode="inner", background=0)[1:-1, 1:-1]
+            boundary = storm.boundary_polygon(1)
+            self.assertEqual(boundary.shape, (2, np.count_nonzero(boundary_image)), "Wrong number of boundary points")
+            self.assertEqual(set(zip(*boundary)), set(zip(storm.x[0][boundary_image], storm.y[0][boundary_image])),
+                             "Wrong boundary points")
+            com_x, com_y = storm.center_of_mass(1)
+            angles = np.arctan2(boundary[1] - com_y, boundary[0] - com_x)
+            self.assertTrue(np.all(np.diff(angles) >= 0), "Boundary points are not in counter-clockwise order")
+            boundary[:] = 0
+            self.assertFalse(np.all(storm.boundary_polygon(1) == 0), "Cached boundary was modified")
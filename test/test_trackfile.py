@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+from hagelslag.processing.STObject import STObject
+from hagelslag.processing.TrackFile import write_track_file, read_track_file, TrackFile
+
+
+class TestTrackFile(unittest.TestCase):
+    def setUp(self):
+        self.out_path = mkdtemp()
+        random_state = np.random.RandomState(3)
+        self.tracks = []
+        for t in range(4):
+            num_steps = t + 1
+            shapes = random_state.randint(2, 12, size=(num_steps, 2))
+            grids = [random_state.gamma(1, 20, size=shape).astype(np.float32) for shape in shapes]
+            masks = [(grid > 10).astype(int) for grid in grids]
+            rows = [np.indices(shape)[0] + 5 * s for s, shape in enumerate(shapes)]
+            cols = [np.indices(shape)[1] + 3 * t for shape in shapes]
+            track = STObject(grids, masks, [c * 3000.0 for c in cols], [r * 3000.0 for r in rows], rows, cols,
+                             t + 1, t + num_steps, dx=3000, u=random_state.normal(size=num_steps),
+                             v=random_state.normal(size=num_steps))
+            track.attributes["uh"] = [grid * 2.0 for grid in grids]
+            if t % 2 == 0:
+                track.attributes["cape"] = [(grid * 100).astype(np.int32) for grid in grids]
+            self.tracks.append(track)
+
+    def tearDown(self):
+        rmtree(self.out_path)
+
+    def assertTracksEqual(self, track, read_track):
+        self.assertTrue(np.array_equal(track.times, read_track.times), "Times do not match")
+        self.assertEqual(track.dx, read_track.dx, "Grid spacing does not match")
+        self.assertTrue(np.array_equal(track.u, read_track.u), "u does not match")
+        self.assertTrue(np.array_equal(track.v, read_track.v), "v does not match")
+        for attr in ["timesteps", "masks", "x", "y", "i", "j"]:
+            for step, read_step in zip(getattr(track, attr), getattr(read_track, attr)):
+                self.assertEqual(step.dtype, read_step.dtype, attr + " dtype does not match")
+                self.assertTrue(np.array_equal(step, read_step), attr + " does not match")
+        self.assertEqual(sorted(track.attributes.keys()), sorted(read_track.attributes.keys()),
+                         "Attribute names do not match")
+        for attribute, steps in track.attributes.items():
+            for step, read_step in zip(steps, read_track.attributes[attribute]):
+                self.assertEqual(step.dtype, read_step.dtype, attribute + " dtype does not match")
+                self.assertTrue(np.array_equal(step, read_step), attribute + " does not match")
+
+    def test_round_trip(self):
+        filename = join(self.out_path, "tracks.nc")
+        metadata = [dict(id="track_{0:d}".format(t), duration=track.times.size) for t, track in enumerate(self.tracks)]
+        write_track_file(self.tracks, filename, metadata)
+        read_tracks = read_track_file(filename)
+        self.assertEqual(len(read_tracks), len(self.tracks), "Wrong number of tracks")
+        for track, read_track in zip(self.tracks, read_tracks):
+            self.assertTracksEqual(track, read_track)
+        with TrackFile(filename) as track_file:
+            self.assertTracksEqual(self.tracks[2], track_file[2])
+            self.assertTracksEqual(self.tracks[-1], track_file[-1])
+            self.assertEqual(track_file.metadata(1), metadata[1], "Metadata does not match")
+        empty_filename = join(self.out_path, "empty.nc")
+        write_track_file([], empty_filename)
+        self.assertEqual(read_track_file(empty_filename), [], "Empty file contains tracks")
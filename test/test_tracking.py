@@ -1,11 +1,17 @@
 import unittest
 import numpy as np
+from scipy.ndimage import find_objects
 from datetime import datetime, timedelta
 from hagelslag.data.ModelOutput import ModelOutput
-from hagelslag.processing.tracker import label_storm_objects, extract_storm_objects
-from hagelslag.processing.TrackProcessing import TrackProcessor
+from hagelslag.processing.tracker import label_storm_objects, extract_storm_objects, track_storms
+from hagelslag.processing.STObject import STObject, tracks_to_geojson
+from hagelslag.processing.TrackProcessing import TrackProcessor, obs_track_filename
+from hagelslag.processing.TrackFile import write_track_file
 from hagelslag.processing.ObjectMatcher import shifted_centroid_distance, centroid_distance, time_distance
 import os
+from pyproj import Proj
+from tempfile import mkdtemp
+from shutil import rmtree
 
 class TestTracking(unittest.TestCase):
     def setUp(self):
@@ -56,6 +62,31 @@ class TestTracking(unittest.TestCase):
                                            self.model_grid.y, np.array([0]))
         self.assertEqual(len(storm_objs[0]), label_grid.max(), "Storm objects do not match number of labeled objects")
 
+    def test_parallel_labeling(self):
+        label_grid = label_storm_objects(self.model_grid.data, "ew", 10, 50, min_area=2, max_area=100, max_range=10)
+        parallel_label_grid = label_storm_objects(self.model_grid.data, "ew", 10, 50, min_area=2, max_area=100,
+                                                  max_range=10, num_workers=2)
+        self.assertTrue(np.array_equal(label_grid, parallel_label_grid), "Parallel labels do not match")
+
+    def test_tiled_smoothed_labeling(self):
+        # Each tile is smoothed separately, so objects within the halo should still match the full domain objects.
+        halo = 40
+        label_grid = label_storm_objects(self.model_grid.data[0], "hyst", 10, 50, min_area=2, gaussian_sd=1)
+        tiled_label_grid = label_storm_objects(self.model_grid.data[0], "hyst", 10, 50, min_area=2, gaussian_sd=1,
+                                               tile_size=100, halo=halo)
+        tiled_labels_3d = label_storm_objects(self.model_grid.data, "hyst", 10, 50, min_area=2, gaussian_sd=1,
+                                              tile_size=100, halo=halo)
+        parallel_labels_3d = label_storm_objects(self.model_grid.data, "hyst", 10, 50, min_area=2, gaussian_sd=1,
+                                                 tile_size=100, halo=halo, num_workers=2)
+        self.assertTrue(np.array_equal(tiled_labels_3d[0], tiled_label_grid), "3D tiled labels do not match")
+        self.assertTrue(np.array_equal(tiled_labels_3d, parallel_labels_3d), "Parallel tiled labels do not match")
+        for l, obj_slice in enumerate(find_objects(label_grid)):
+            if obj_slice is not None and max([s.stop - s.start for s in obj_slice]) < halo:
+                tiled_labels = np.unique(tiled_label_grid[label_grid == l + 1])
+                self.assertEqual(tiled_labels.size, 1, "Tiled object was split")
+                self.assertTrue(np.array_equal(tiled_label_grid == tiled_labels[0], label_grid == l + 1),
+                                "Tiled object does not match full domain object")
+
     def test_track_processing(self):
         ws_params = (25, 50)
         object_matcher_params = ([shifted_centroid_distance], np.array([1.0]),
@@ -74,3 +105,95 @@ class TestTracking(unittest.TestCase):
         #track_model_objects = tp.find_model_tracks()
         #self.assertGreater(len(track_model_objects), 0, "No objects found")
 
+
+class TestTiledLabeling(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(5)
+        rows, cols = np.indices((150, 180))
+        self.data = np.zeros(rows.shape)
+        for center in random_state.uniform(5, 175, size=(60, 2)):
+            self.data = np.maximum(self.data, random_state.uniform(20, 60) *
+                                   np.exp(-0.5 * ((rows - center[0] * 150 / 180.0) ** 2 +
+                                                  (cols - center[1]) ** 2) / random_state.uniform(2, 9)))
+
+    def test_tiled_labeling(self):
+        halo = 20
+        label_grid = label_storm_objects(self.data, "hyst", 10, 30, min_area=2)
+        tiled_label_grid = label_storm_objects(self.data, "hyst", 10, 30, min_area=2, tile_size=50, halo=halo)
+        self.assertGreater(label_grid.max(), 10, "Too few objects")
+        for l, obj_slice in enumerate(find_objects(label_grid)):
+            if obj_slice is not None and max([s.stop - s.start for s in obj_slice]) < halo:
+                tiled_labels = np.unique(tiled_label_grid[label_grid == l + 1])
+                self.assertEqual(tiled_labels.size, 1, "Tiled object was split")
+                self.assertTrue(np.array_equal(tiled_label_grid == tiled_labels[0], label_grid == l + 1),
+                                "Tiled object does not match full domain object")
+        # The enhanced watershed and watershed depend on the whole domain, so they cannot be tiled.
+        for method in ["ew", "ws"]:
+            with self.assertRaises(ValueError):
+                label_storm_objects(self.data, method, 10, 30, min_area=2, tile_size=50, halo=halo)
+
+
+class TestTrackStorms(unittest.TestCase):
+    def test_track_storms(self):
+        rows, cols = np.indices((3, 3))
+        storm_objects = []
+        for time in range(4):
+            storm_objects.append([])
+            # Two storms moving east, one ending after time 1, and a new storm far away at time 2
+            for corner, end_time in [((10, 10), 3), ((40, 40), 1), ((80, 5), 3)]:
+                if time <= end_time and (corner[0] < 80 or time >= 2):
+                    i = rows + corner[0]
+                    j = cols + corner[1] + 2 * time
+                    storm_objects[-1].append(STObject(np.ones((3, 3)), np.ones((3, 3), dtype=int), j * 3000.0,
+                                                      i * 3000.0, i, j, time, time))
+        tracks = track_storms(storm_objects[:2], np.arange(2), [centroid_distance, time_distance],
+                              np.array([20000, 1]), np.array([0.8, 0.2]))
+        tracks = track_storms(storm_objects[2:], np.arange(2, 4), [centroid_distance, time_distance],
+                              np.array([20000, 1]), np.array([0.8, 0.2]), tracked_objects=tracks)
+        self.assertEqual(len(tracks), 3, "Wrong number of tracks")
+        self.assertEqual([list(track.times) for track in tracks], [[0, 1, 2, 3], [0, 1], [2, 3]],
+                         "Wrong track times")
+        for track in tracks:
+            self.assertEqual(len(np.unique([i.min() for i in track.i])), 1, "Track contains different storms")
+
+
+class TestObsTrackFiles(unittest.TestCase):
+    def setUp(self):
+        self.out_path = mkdtemp() + "/"
+        self.run_date = datetime(2015, 6, 4, 0)
+        self.member = "wrf-s3cn_arw"
+        rows, cols = np.indices((4, 5))
+        self.tracks = [STObject(np.ones((4, 5)) * (t + 1), np.ones((4, 5), dtype=int), cols * 3000.0, rows * 3000.0,
+                                rows, cols + 10 * t, t, t, dx=3000) for t in range(3)]
+        self.metadata = [dict(id="mesh_{0:03d}".format(t), ensemble_member=self.member, duration=1)
+                         for t in range(3)]
+        # load_mrms_tracks only needs the run date and member, so the model data are not loaded
+        self.track_proc = TrackProcessor.__new__(TrackProcessor)
+        self.track_proc.run_date = self.run_date
+        self.track_proc.ensemble_member = self.member
+
+    def tearDown(self):
+        rmtree(self.out_path)
+
+    def test_netcdf_obs_tracks(self):
+        for run_date_format in ["%Y%m%d-%H%M", "%Y%m%d"]:
+            track_filename = obs_track_filename(self.out_path, self.run_date, self.member,
+                                                run_date_format=run_date_format)
+            os.makedirs(os.path.dirname(track_filename))
+            write_track_file(self.tracks, track_filename, self.metadata)
+            mrms_tracks = self.track_proc.load_mrms_tracks(self.out_path, run_date_format=run_date_format)
+            self.assertEqual(len(mrms_tracks), len(self.tracks), "Obs track file not found")
+            for track, mrms_track in zip(self.tracks, mrms_tracks):
+                self.assertTrue(np.array_equal(track.timesteps[0], mrms_track.timesteps[0]), "Tracks do not match")
+
+    def test_geojson_obs_tracks(self):
+        proj = Proj(proj="lcc", lat_1=30, lat_2=60, lat_0=38, lon_0=-97)
+        for run_date_format in ["%Y%m%d-%H%M", "%Y%m%d"]:
+            track_filename = obs_track_filename(self.out_path, self.run_date, self.member,
+                                                run_date_format=run_date_format, extension=".json")
+            os.makedirs(os.path.dirname(track_filename))
+            tracks_to_geojson(self.tracks, track_filename, proj, self.metadata)
+            mrms_tracks = self.track_proc.load_mrms_tracks(self.out_path, run_date_format=run_date_format)
+            self.assertEqual(len(mrms_tracks), len(self.tracks), "Obs track collection not found")
+            for track, mrms_track in zip(self.tracks, mrms_tracks):
+                self.assertTrue(np.array_equal(track.timesteps[0], mrms_track.timesteps[0]), "Tracks do not match")